@@ -3,3 +3,13 @@ from .player import *
 from .exceptions import *
 from .eq import *
 from .track import *
+from .cache import *
+from .queue import *
+from .scheduler import *
+from .events import *
+from .codec import *
+from .metrics import *
+from .ratelimit import *
+from .rest import *
+from .positions import *
+from .watchdog import *
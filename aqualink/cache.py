@@ -0,0 +1,238 @@
+import asyncio
+import logging
+import sqlite3
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Hashable, List, Optional
+from .codec import Codec, get_codec
+
+log = logging.getLogger(__name__)
+
+
+class QueryCache:
+    """
+    A bounded LRU cache with a time to live for :meth:`Connection.query` results.
+    Results are keyed on a (query, lazy) tuple. Concurrent lookups of an uncached key share a single in-flight request.
+    :param max_size: The maximum amount of cached results.
+    :param ttl: How long (in seconds) a cached result stays valid.
+    """
+
+    __slots__ = (
+        "max_size",
+        "ttl",
+        "hits",
+        "misses",
+        "evictions",
+        "coalesced",
+        "_entries",
+        "_pending",
+    )
+
+    def __init__(self, max_size: int = 1024, ttl: float = 300.0) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.coalesced = 0
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._pending = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, count=False) is not None
+
+    def get(self, key: Hashable, *, count: bool = True) -> Optional[Any]:
+        """Returns a cached value or None if it is missing or expired."""
+        try:
+            expires_at, value = self._entries[key]
+        except KeyError:
+            if count:
+                self.misses += 1
+            return None
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self.evictions += 1
+            if count:
+                self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        if count:
+            self.hits += 1
+        return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Stores a value, evicting the least recently used entries if the cache is full."""
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        """Removes a value from the cache."""
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Removes all values from the cache."""
+        self._entries.clear()
+
+    async def fetch(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Returns the cached value for a key or awaits the factory to produce it.
+        The factory runs as a task shared by every caller of that key, so cancelling one caller does not affect the others.
+        Empty results are not cached.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        task = self._pending.get(key)
+        if task is None:
+            task = self._pending[key] = asyncio.ensure_future(self._run(key, factory))
+            # keeps a failure nobody waits for anymore from being logged as unretrieved
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        else:
+            self.coalesced += 1
+        # a cancelled caller leaves the shared request running for the others
+        return await asyncio.shield(task)
+
+    async def _run(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            value = await factory()
+        finally:
+            del self._pending[key]
+        if value:
+            self.put(key, value)
+        return value
+
+
+class PersistentQueryCache:
+    """
+    An on-disk SQLite cache of raw /loadtracks results that survives restarts.
+    The database runs in WAL mode, so every process of a bot cluster on the same host can share one file.
+    Every 100 writes, expired entries are removed and the entries closest to expiry are evicted down to max_size.
+    :param path: The database file.
+    :param ttl: How long (in seconds) a cached result stays valid.
+    :param max_size: The maximum amount of cached results.
+    :param codec: (optional) The :class:`Codec` used to serialize results.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        ttl: float = 86400.0,
+        max_size: int = 100000,
+        codec: Optional[Codec] = None,
+    ) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._codec = codec or get_codec()
+        self._writes = 0
+        # sqlite connections must not be used from several threads at once
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._db = sqlite3.connect(path, timeout=5.0, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS queries ("
+            "identifier TEXT PRIMARY KEY, expires REAL NOT NULL, tracks BLOB NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS queries_expires ON queries (expires)"
+        )
+        self._db.commit()
+
+    def __len__(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM queries").fetchone()[0]
+
+    async def _run(self, func, *args):
+        return await asyncio.get_event_loop().run_in_executor(
+            self._executor, func, *args
+        )
+
+    def _get(self, identifier: str) -> Optional[bytes]:
+        row = self._db.execute(
+            "SELECT tracks FROM queries WHERE identifier = ? AND expires > ?",
+            (identifier, time.time()),
+        ).fetchone()
+        return row[0] if row is not None else None
+
+    def _delete(self, identifier: str) -> None:
+        with self._db:
+            self._db.execute("DELETE FROM queries WHERE identifier = ?", (identifier,))
+
+    def _put(self, identifier: str, blob: bytes) -> None:
+        now = time.time()
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO queries VALUES (?, ?, ?)",
+                (identifier, now + self.ttl, blob),
+            )
+        self._writes += 1
+        if self._writes % 100 == 0:
+            self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        with self._db:
+            evicted = self._db.execute(
+                "DELETE FROM queries WHERE expires <= ?", (now,)
+            ).rowcount
+            excess = len(self) - self.max_size
+            if excess > 0:
+                evicted += self._db.execute(
+                    "DELETE FROM queries WHERE identifier IN "
+                    "(SELECT identifier FROM queries ORDER BY expires LIMIT ?)",
+                    (excess,),
+                ).rowcount
+        self.evictions += evicted
+
+    async def get(self, identifier: str) -> Optional[List[dict]]:
+        """Returns the cached raw tracks of a query, or None if they are missing, expired or unreadable."""
+        try:
+            blob = await self._run(self._get, identifier)
+        except sqlite3.Error:
+            log.warning(
+                "Reading %s from the query cache failed", identifier, exc_info=True
+            )
+            blob = None
+        if blob is None:
+            self.misses += 1
+            return None
+        try:
+            tracks = self._codec.loads(zlib.decompress(blob))
+        except (zlib.error, ValueError):
+            # e.g. a truncated write, dropped so the query is fetched and stored again
+            log.warning("Dropping unreadable query cache entry %s", identifier)
+            self.misses += 1
+            try:
+                await self._run(self._delete, identifier)
+            except sqlite3.Error:
+                pass
+            return None
+        self.hits += 1
+        return tracks
+
+    async def put(self, identifier: str, tracks: List[dict]) -> None:
+        """Stores the raw tracks of a query."""
+        blob = zlib.compress(self._codec.dumps(tracks).encode(), 1)
+        try:
+            await self._run(self._put, identifier, blob)
+        except sqlite3.Error:
+            log.warning(
+                "Writing %s to the query cache failed", identifier, exc_info=True
+            )
+
+    def close(self) -> None:
+        """Closes the database."""
+        self._executor.shutdown()
+        self._db.close()
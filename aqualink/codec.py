@@ -0,0 +1,50 @@
+import json
+from functools import partial
+from typing import Any, Callable, NamedTuple, Optional, Union
+
+
+class Codec(NamedTuple):
+    """A JSON implementation used to decode Lavalink frames and encode outbound ops."""
+
+    name: str
+    loads: Callable[[Union[str, bytes]], Any]
+    dumps: Callable[[Any], str]
+
+
+def _orjson() -> Codec:
+    import orjson
+
+    _dumps = orjson.dumps
+    # websockets sends bytes as binary frames, Lavalink only reads text frames
+    return Codec("orjson", orjson.loads, lambda obj: _dumps(obj).decode())
+
+
+def _ujson() -> Codec:
+    import ujson
+
+    return Codec("ujson", ujson.loads, ujson.dumps)
+
+
+def _stdlib() -> Codec:
+    return Codec("json", json.loads, partial(json.dumps, separators=(",", ":")))
+
+
+CODECS = {"orjson": _orjson, "ujson": _ujson, "json": _stdlib}
+
+
+def get_codec(name: Optional[str] = None) -> Codec:
+    """
+    Returns a JSON codec.
+    :param name: (optional) "orjson", "ujson" or "json". Defaults to the fastest one that is installed.
+    """
+    if name is not None:
+        try:
+            return CODECS[name]()
+        except KeyError:
+            raise ValueError(f"Unknown codec {name}") from None
+    for factory in (_orjson, _ujson):
+        try:
+            return factory()
+        except ImportError:
+            pass
+    return _stdlib()
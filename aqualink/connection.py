@@ -1,7 +1,10 @@
 import websockets
 import aiohttp
-import ujson
 import asyncio
+import gzip
+import logging
+import random
+import secrets
 import time
 
 try:
@@ -14,102 +17,643 @@ except ImportError:
     except ImportError:
         raise ImportError("You don't have discord.py or discord.jspy installed!")
 
-from typing import Union, Optional, List
-from .exceptions import Disconnected
+from collections import deque
+from typing import (
+    AsyncIterator,
+    Callable,
+    Iterable,
+    Union,
+    Optional,
+    List,
+    Tuple,
+)
+from .cache import PersistentQueryCache, QueryCache
+from .codec import Codec, get_codec
+from .events import EVENT_TYPES, EventDispatcher, compile_callback
+from .exceptions import CircuitOpen, Disconnected
+from .metrics import Metrics
 from .player import Player
-from .track import Track
+from .positions import PositionHub
+from .ratelimit import TokenBucket
+from .rest import CircuitBreaker
+from .scheduler import SendScheduler
+from .templates import OpTemplates, encode_bands
+from .track import Track, TrackList
+from .watchdog import Watchdog
+
+log = logging.getLogger(__name__)
+
+
+class Node:
+    """
+    Represents a single Lavalink node of a :class:`Connection`'s node pool.
+    If the websocket drops, the node reconnects with exponential backoff and resumes its Lavalink session.
+    Ops sent in the meantime are buffered and replayed once the node is back.
+    """
+
+    def __init__(
+        self,
+        connection,
+        password: str,
+        ws_url: str,
+        rest_url: str,
+        *,
+        resume_timeout: int = 60,
+        buffer_size: int = 256,
+        max_backoff: float = 60.0,
+    ) -> None:
+        self.connection = connection
+        self.password = password
+        self.ws_url = ws_url
+        self.rest_url = rest_url
+        self.resume_timeout = resume_timeout
+        self.resume_key = secrets.token_hex(16) if resume_timeout else None
+        self.max_backoff = max_backoff
+        self.stats = None
+        self.breaker = CircuitBreaker(
+            connection._breaker_threshold, connection._breaker_cooldown
+        )
+        self._socket = None
+        self._closing = False
+        self._reconnecting = False
+        self._buffer = deque()
+        self._buffer_size = buffer_size
+        self._assigned = 0  # players assigned since the last stats frame
+        self._labels = (("node", ws_url),)
+
+    def __repr__(self):
+        return f"<Node ws_url={self.ws_url} connected={self.connected}>"
+
+    @property
+    def connected(self) -> bool:
+        """Returns the node's websocket connection state."""
+        if self._socket is None:
+            return False
+        else:
+            return self._socket.open
+
+    @property
+    def penalty(self) -> float:
+        """Returns the node's load penalty. Lower is better, disconnected nodes are infinite."""
+        if not self.connected:
+            return float("inf")
+        if self.stats is None:
+            return float(self._assigned)
+
+        penalty = self.stats["playingPlayers"] + self._assigned
+        penalty += 1.05 ** (100 * self.stats["cpu"]["lavalinkLoad"]) * 10 - 10
+        frames = self.stats.get("frameStats")
+        if frames:
+            # frame stats are per minute, 3000 frames are sent per player
+            penalty += 1.03 ** (500 * frames["deficit"] / 3000) * 600 - 600
+            penalty += (1.03 ** (500 * frames["nulled"] / 3000) * 300 - 300) * 2
+        return penalty
+
+    async def connect(self) -> None:
+        await self._open()
+        self.connection._loop.create_task(self.event_processor())
+
+    async def close(self) -> None:
+        """Closes the node's websocket without reconnecting."""
+        self._closing = True
+        self._buffer.clear()
+        if self._socket is not None:
+            await self._socket.close()
+
+    async def _open(self, resume: bool = False) -> bool:
+        headers = {
+            "Authorization": self.password,
+            "Num-Shards": self.connection._shard_count,
+            "User-Id": self.connection.bot.user.id,
+        }
+        if resume and self.resume_key:
+            headers["Resume-Key"] = self.resume_key
+        self._socket = await websockets.connect(self.ws_url, extra_headers=headers)
+        if self.resume_key:
+            await self._socket.send(
+                self.connection.codec.dumps(
+                    {
+                        "op": "configureResuming",
+                        "key": self.resume_key,
+                        "timeout": self.resume_timeout,
+                    }
+                )
+            )
+        return self._socket.response_headers.get("Session-Resumed") == "true"
+
+    async def _reconnect(self) -> None:
+        self._reconnecting = True
+        if not self.connection.connected:
+            self.connection._ready.clear()
+        try:
+            attempt = 0
+            while not self._closing:
+                delay = min(self.max_backoff, 2**attempt)
+                await asyncio.sleep(random.uniform(delay / 2, delay))
+                attempt += 1
+                try:
+                    resumed = await self._open(resume=True)
+                except (OSError, asyncio.TimeoutError, websockets.WebSocketException):
+                    continue
+
+                try:
+                    if not resumed:
+                        # the old session is gone, rebuild our players on the new one
+                        for player in list(self.connection._players.values()):
+                            if player._node is self:
+                                for data in player._state_ops():
+                                    await self._socket.send(self._encode(data))
+                    while self._buffer:
+                        await self._socket.send(self._buffer[0])
+                        self._buffer.popleft()
+                except websockets.ConnectionClosed:
+                    # dropped again, the replay and the rest of the buffer go to the next socket
+                    continue
+                self.connection._ready.set()
+                if self.connection.metrics is not None:
+                    self.connection.metrics.inc(
+                        "aqualink_reconnects_total", self._labels
+                    )
+                return
+        finally:
+            self._reconnecting = False
+
+    async def event_processor(self) -> None:
+        loads = self.connection.codec.loads
+        metrics = self.connection.metrics
+        watchdog = self.connection.watchdog
+        while not self._closing:
+            try:
+                frame = await self._socket.recv()
+            except websockets.ConnectionClosed:
+                if self._closing:
+                    break
+                await self._reconnect()
+                continue
+
+            start = (
+                time.perf_counter()
+                if watchdog is not None and watchdog.sample()
+                else None
+            )
+            json = loads(frame)
+            op = json.get("op")
+            event_player = None
+            if metrics is not None:
+                metrics.inc("aqualink_frames_total", self._labels + (("op", op),))
+
+            if op == "stats":
+                json.pop("op")
+                self.stats = json
+                self._assigned = 0
+
+            elif op == "playerUpdate" and "position" in json["state"]:
+                player = self.connection._players.get(int(json["guildId"]))
+                # a player moved to another node (see Connection.migrate) ignores its old one
+                if player is not None and player._node is self:
+                    # extrapolated from here with the local monotonic clock, see Player.position
+                    player._set_position(json["state"]["position"] / 1000)
+
+            elif op == "event":
+                if metrics is not None:
+                    metrics.inc(
+                        "aqualink_events_total",
+                        self._labels + (("type", json["type"]),),
+                    )
+                player = self.connection._players.get(int(json["guildId"]))
+                if player is not None and player._node is self:
+                    event_player = player
+
+            if start is not None:
+                watchdog.check(
+                    "frame", op, json.get("guildId"), time.perf_counter() - start
+                )
+            if event_player is not None:
+                await self.connection.dispatcher.put(event_player, json)
+
+        if not self.connection.connected:
+            self.connection._ready.clear()
+
+    def _encode(self, data: dict) -> str:
+        try:
+            data["guildId"] = str(data["guildId"])
+            data["channelId"] = str(data["channelId"])
+        except KeyError:
+            pass
+        return self.connection.codec.dumps(data)
+
+    async def _send(self, data: dict) -> None:
+        await self._send_encoded(data["op"], self._encode(data))
+
+    async def _send_encoded(self, op: str, frame: str) -> None:
+        metrics = self.connection.metrics
+        if metrics is not None:
+            labels = self._labels + (("op", op),)
+        if self._reconnecting:
+            if len(self._buffer) >= self._buffer_size:
+                if metrics is not None:
+                    metrics.inc("aqualink_op_failures_total", labels)
+                raise Disconnected("The outbound buffer is full.")
+            self._buffer.append(frame)
+        elif not self.connected:
+            if metrics is not None:
+                metrics.inc("aqualink_op_failures_total", labels)
+            raise Disconnected()
+        else:
+            await self._socket.send(frame)
+        if metrics is not None:
+            metrics.inc("aqualink_ops_total", labels)
 
 
 class Connection:
-    def __init__(self, bot: Union[commands.Bot, commands.AutoShardedBot]) -> None:
+    """
+    Manages the Lavalink nodes and players of a bot.
+    :param bot: The discord.py bot.
+    :param query_cache: (optional) A :class:`QueryCache` for :meth:`Connection.query` results.
+    :param persistent_cache: (optional) A :class:`PersistentQueryCache` checked before asking Lavalink.
+    :param coalesce_window: (optional) Collapse superseded ops within this many seconds, see :class:`SendScheduler`.
+    :param codec: (optional) A :class:`Codec` or codec name, defaults to the fastest installed one.
+    :param metrics: (optional) Whether to record :class:`Metrics` (defaults to False).
+    :param idle_timeout: (optional) Drop idle players after this many seconds, see :meth:`Connection.evict_idle_players`.
+    :param voice_rate: (optional) How many voice reconnects per second are sent through a shard after it comes back.
+    :param voice_burst: (optional) How many voice reconnects a shard may send at once.
+    :param rest_timeout: (optional) The total timeout of a REST request in seconds (defaults to 10).
+    :param rest_limit: (optional) How many REST connections may be open at once (defaults to 100).
+    :param rest_keepalive: (optional) How long idle REST connections are kept open in seconds (defaults to 30).
+    :param breaker_threshold: (optional) After how many consecutive REST failures a node is skipped (defaults to 5).
+    :param breaker_cooldown: (optional) How long a failing node is skipped before it is tried again (defaults to 30).
+    :param event_concurrency: (optional) How many player events may be processed at once (defaults to 100).
+    :param event_queue_size: (optional) How many events a guild may have waiting (defaults to 100).
+    :param event_overflow: (optional) What happens to events beyond that, see :class:`EventDispatcher`.
+    :param watchdog: (optional) Report event loop stalls, callbacks and frames slower than this many seconds, see :class:`Watchdog`.
+    :param watchdog_interval: (optional) How often the watchdog measures the event loop lag (defaults to a quarter of the threshold).
+    :param watchdog_sample_rate: (optional) The share of callbacks and frames the watchdog times (defaults to 0.1).
+    :param watchdog_hook: (optional) A callable receiving each :class:`Offender` instead of logging it.
+    """
+
+    def __init__(
+        self,
+        bot: Union[commands.Bot, commands.AutoShardedBot],
+        *,
+        query_cache: Optional[QueryCache] = None,
+        persistent_cache: Optional[PersistentQueryCache] = None,
+        coalesce_window: Optional[float] = None,
+        codec: Union[Codec, str, None] = None,
+        metrics: bool = False,
+        idle_timeout: Optional[float] = None,
+        voice_rate: float = 100 / 60,
+        voice_burst: int = 5,
+        rest_timeout: float = 10.0,
+        rest_limit: int = 100,
+        rest_keepalive: float = 30.0,
+        breaker_threshold: int = 5,
+        breaker_cooldown: float = 30.0,
+        event_concurrency: int = 100,
+        event_queue_size: int = 100,
+        event_overflow: str = "drop_oldest",
+        watchdog: Optional[float] = None,
+        watchdog_interval: Optional[float] = None,
+        watchdog_sample_rate: float = 0.1,
+        watchdog_hook: Optional[Callable] = None,
+    ) -> None:
+        self._sharded = isinstance(bot, commands.AutoShardedBot)
         bot.add_listener(self._handler, "on_socket_response")
+        if self._sharded:
+            bot.add_listener(self._on_shard_disconnect, "on_shard_disconnect")
+            bot.add_listener(self._on_shard_ready, "on_shard_ready")
+            bot.add_listener(self._on_shard_ready, "on_shard_resumed")
+        else:
+            bot.add_listener(self._on_disconnect, "on_disconnect")
+            bot.add_listener(self._on_ready, "on_ready")
+            bot.add_listener(self._on_ready, "on_resumed")
         self.bot = bot
         self._loop = bot.loop
-        self._sharded = isinstance(bot, commands.AutoShardedBot)
         self._shard_count = bot.shard_count if bot.shard_count is not None else 1
-        self._socket = None
-        self._down = {}
+        self._shard_id = bot.shard_id if bot.shard_id is not None else 0
+        self._nodes = []
+        self._down = set()
+        self._reconnects = {}  # shard id -> reconnect task
+        self._buckets = {}  # shard id -> TokenBucket for voice state updates
+        self._voice_rate = voice_rate
+        self._voice_burst = voice_burst
+        self._rest_timeout = rest_timeout
+        self._rest_limit = rest_limit
+        self._rest_keepalive = rest_keepalive
+        self._breaker_threshold = breaker_threshold
+        self._breaker_cooldown = breaker_cooldown
+        self._ready = asyncio.Event()
         self._players = {}
+        self._shards = {}  # shard id -> set of players connected to voice
+        self._voice_waiters = {}  # guild id -> future resolved on the next voiceUpdate
+        self._gateway_handlers = {
+            "VOICE_STATE_UPDATE": self._voice_state_update,
+            "VOICE_SERVER_UPDATE": self._voice_server_update,
+        }
+        self._listeners = {}  # event type -> ((callback, compiled callback), ...)
+        self.codec = codec if isinstance(codec, Codec) else get_codec(codec)
+        self.query_cache = query_cache
+        self.persistent_cache = persistent_cache
+        self.metrics = Metrics(self) if metrics else None
+        self.idle_timeout = idle_timeout
+        self._eviction_task = None
+        self.scheduler = (
+            SendScheduler(self, coalesce_window) if coalesce_window else None
+        )
+        self.position_hub = PositionHub(self)
+        self.watchdog = (
+            Watchdog(
+                self, watchdog, watchdog_interval, watchdog_sample_rate, watchdog_hook
+            )
+            if watchdog
+            else None
+        )
+        self.dispatcher = EventDispatcher(
+            self, event_concurrency, event_queue_size, event_overflow
+        )
+
+    def add_listener(self, event: str, callback: Callable) -> None:
+        """
+        Registers a callback for a Lavalink event of any player.
+        The callback may be awaitable and is called with the arguments it asks for, see :func:`compile_callback`.
+        :param event: The event type, e.g. "TrackStartEvent", "TrackEndEvent", "TrackExceptionEvent",
+            "TrackStuckEvent" or "WebSocketClosedEvent".
+        :param callback: The callable to register.
+        """
+        if event not in EVENT_TYPES:
+            raise ValueError(f"Unknown event type {event}")
+        self._listeners[event] = self._listeners.get(event, ()) + (
+            (callback, compile_callback(callback)),
+        )
+
+    def remove_listener(self, event: str, callback: Callable) -> None:
+        """Removes a callback registered with :meth:`Connection.add_listener`."""
+        listeners = tuple(
+            entry for entry in self._listeners.get(event, ()) if entry[0] != callback
+        )
+        if listeners:
+            self._listeners[event] = listeners
+        else:
+            self._listeners.pop(event, None)
+
+    def listen(self, event: str) -> Callable:
+        """A decorator that registers the decorated function with :meth:`Connection.add_listener`."""
+
+        def decorator(callback):
+            self.add_listener(event, callback)
+            return callback
+
+        return decorator
 
     @classmethod
-    def connect_to(cls, bot: Union[commands.Bot, commands.AutoShardedBot]):
-        bot.aqualink = cls(bot)
+    def connect_to(cls, bot: Union[commands.Bot, commands.AutoShardedBot], **kwargs):
+        bot.aqualink = cls(bot, **kwargs)
 
     async def _handler(self, data):
-        if not self.connected:
+        # runs for every gateway event, so bail out after a single lookup
+        handler = self._gateway_handlers.get(data.get("t")) if data else None
+        if handler is not None:
+            await handler(data["d"])
+
+    async def _voice_state_update(self, data) -> None:
+        player = self._players.get(int(data["guild_id"]))
+        if player is None or int(data["user_id"]) != self.bot.user.id:
             return
+        channel_id = data["channel_id"]
+        if channel_id is None:
+            # left voice, e.g. kicked or moved out by a moderator
+            player._channel = None
+            player._voice_state = None
+            player._session_id = None
+            player._voice_server = None
+        else:
+            player._channel = int(channel_id)
+            player._session_id = data["session_id"]
+        self._index_player(player)
+        if channel_id is not None and player._voice_server is not None:
+            await self._send_voice_update(player)
 
-        if not data:
+    async def _voice_server_update(self, data) -> None:
+        player = self._players.get(int(data["guild_id"]))
+        if player is None or not player._connecting:
             return
-        if data["op"] != 0:
+        # Discord sends the voice state and voice server updates in either order
+        player._voice_server = data
+        if player._session_id is not None:
+            await self._send_voice_update(player)
+
+    async def _send_voice_update(self, player: Player) -> None:
+        if not player._connecting:
+            return
+        node = player._node
+        # a reconnecting node buffers the update until it is back
+        if node is not None:
+            available = node.connected or node._reconnecting
+        else:
+            available = any(n.connected or n._reconnecting for n in self._nodes)
+        if not available:
             return
+        data, player._voice_server = player._voice_server, None
+        player._connecting = False
 
-        if data["t"] == "VOICE_SERVER_UPDATE":
-            player = self.get_player(int(data["d"]["guild_id"]))
-            if not player._connecting:
-                return
-            else:
-                player._connecting = False
-
-            payload = {
-                "op": "voiceUpdate",
-                "guildId": data["d"]["guild_id"],
-                "sessionId": self.bot.get_guild(
-                    int(data["d"]["guild_id"])
-                ).me.voice.session_id,
-                "event": data["d"],
-            }
-            await self._send(**payload)
-
-    async def connect(self, password: str, ws_url: str, rest_url: str) -> None:
+        payload = {
+            "op": "voiceUpdate",
+            "guildId": data["guild_id"],
+            "sessionId": player._session_id,
+            "event": data,
+        }
+        player._voice_state = payload
+        await self._send(**payload)
+
+        waiter = self._voice_waiters.pop(player._guild, None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    async def connect(
+        self, password: str, ws_url: str, rest_url: str, **kwargs
+    ) -> Node:
+        """
+        Connects to a Lavalink node and adds it to the node pool.
+        May be called multiple times to balance players across several nodes.
+        :param password: The node's password.
+        :param ws_url: The node's websocket URL.
+        :param rest_url: The node's REST URL.
+        :param resume_timeout: (optional) How long Lavalink keeps the session alive after a disconnect (defaults to 60). 0 disables resuming.
+        :param buffer_size: (optional) How many ops are buffered while reconnecting (defaults to 256).
+        :param max_backoff: (optional) The maximum delay between reconnect attempts (defaults to 60).
+        :return: The connected Node.
+        """
         await self.bot.wait_until_ready()
         if not hasattr(self, "session"):
-            self.session = aiohttp.ClientSession(loop=self._loop)
-        headers = {
-            "Authorization": password,
-            "Num-Shards": self._shard_count,
-            "User-Id": self.bot.user.id,
-        }
-        self._password = password
-        self._rest_url = rest_url
-        self._ws_url = ws_url
-        self._socket = await websockets.connect(ws_url, extra_headers=headers)
-        self._loop.create_task(self.event_processor())
-        self._loop.create_task(self._discord_connection_state_loop())
-
-    async def _discord_connection_state_loop(self) -> None:
-        while self.connected:
-            shard_guilds = {}
-            for guild, player in self._players.items():
-                if not player.connected:
-                    continue
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self._rest_limit, keepalive_timeout=self._rest_keepalive
+                ),
+                timeout=aiohttp.ClientTimeout(total=self._rest_timeout),
+                loop=self._loop,
+            )
+        node = Node(self, password, ws_url, rest_url, **kwargs)
+        await node.connect()
+        self._nodes.append(node)
+        self._ready.set()
+        if self.idle_timeout and self._eviction_task is None:
+            self._eviction_task = self._loop.create_task(self._eviction_loop())
+        if self.watchdog is not None:
+            self.watchdog.start()
+        return node
+
+    async def migrate(
+        self,
+        ws_url: str,
+        rest_url: str,
+        *,
+        password: Optional[str] = None,
+        nodes: Optional[Iterable[Node]] = None,
+        concurrency: int = 100,
+        **kwargs,
+    ) -> Node:
+        """
+        Moves players to a new Lavalink node without stopping playback, then closes the old nodes.
+        Each player's voice state, track at its current position, volume and equalizer are sent to
+        the new node before the player is destroyed on its old one.
+        :param ws_url: The new node's websocket URL.
+        :param rest_url: The new node's REST URL.
+        :param password: (optional) The new node's password, defaults to the password of the first drained node.
+        :param nodes: (optional) The nodes to drain, defaults to all current nodes.
+        :param concurrency: (optional) How many players may be moved at once (defaults to 100).
+        :param kwargs: Passed on to the new :class:`Node`, see :meth:`Connection.connect`.
+        :return: The new Node.
+        """
+        old = list(self._nodes) if nodes is None else list(nodes)
+        if password is None:
+            if not old:
+                raise ValueError(
+                    "A password is required when there is no node to drain"
+                )
+            password = old[0].password
 
-                shard_id = (guild >> 22) % self._shard_count
+        node = await self.connect(password, ws_url, rest_url, **kwargs)
+        drained = set(old)
+        # new players are assigned to the new node from here on
+        self._nodes = [n for n in self._nodes if n not in drained]
 
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def move(player):
+            async with semaphore:
+                previous = player._node
+                ops = player._state_ops()
+                # ops sent while moving already go to the new node
+                player._node = node
+                node._assigned += 1
                 try:
-                    shard_guilds[shard_id].append(player)
-                except KeyError:
-                    shard_guilds[shard_id] = [player]
-
-            for shard, players in shard_guilds.items():
-                ws = self._get_discord_ws(shard)
-                if not ws or not ws.open:
-                    # the shard is down
-                    self._down[shard] = True
-                    continue
+                    for data in ops:
+                        await node._send(data)
+                except Disconnected:
+                    # replayed by the new node's reconnect, see Node._reconnect
+                    log.warning(
+                        "New node disconnected while moving guild %d", player._guild
+                    )
+                if ops and previous.connected:
+                    try:
+                        await previous._send(
+                            {"op": "destroy", "guildId": player._guild}
+                        )
+                    except (Disconnected, websockets.ConnectionClosed):
+                        pass  # the old session ends with its socket anyway
 
-                if shard in self._down:
-                    # the shard is online again
-                    self._down.pop(shard)
-                    self._loop.create_task(self._discord_reconnect_task(players))
+        await asyncio.gather(
+            *[
+                move(player)
+                for player in self._players.values()
+                if player._node in drained
+            ]
+        )
+        for previous in old:
+            if previous.connected:
+                try:
+                    # players that were not destroyed must not outlive the socket
+                    await previous._send({"op": "configureResuming", "key": None})
+                except (Disconnected, websockets.ConnectionClosed):
+                    pass
+            await previous.close()
+        return node
 
-            await asyncio.sleep(0.1)
+    async def _on_shard_disconnect(self, shard_id: int) -> None:
+        self._down.add(shard_id)
+        task = self._reconnects.pop(shard_id, None)
+        if task is not None:
+            task.cancel()
 
-    async def _discord_reconnect_task(self, players) -> None:
-        await asyncio.sleep(10)  # fixed wait for READY / RESUMED
+    async def _on_shard_ready(self, shard_id: int) -> None:
+        if shard_id not in self._down:
+            return
+        # the shard sent READY or RESUMED, so it is online again
+        self._down.discard(shard_id)
+        if shard_id in self._shards:
+            self._reconnects[shard_id] = self._loop.create_task(
+                self._discord_reconnect_task(shard_id)
+            )
+
+    def _index_player(self, player: Player) -> None:
+        shard_id = (player._guild >> 22) % self._shard_count
+        if player._channel is not None:
+            try:
+                self._shards[shard_id].add(player)
+            except KeyError:
+                self._shards[shard_id] = {player}
+            return
+        players = self._shards.get(shard_id)
+        if players is not None:
+            players.discard(player)
+            if not players:
+                del self._shards[shard_id]
+
+    def get_shard_players(self, shard_id: int) -> List[Player]:
+        """Returns the players connected to a voice channel through a shard."""
+        return list(self._shards.get(shard_id, ()))
+
+    @property
+    def shard_player_counts(self) -> dict:
+        """Returns a mapping of shard ID to the amount of players connected through it."""
+        return {shard_id: len(players) for shard_id, players in self._shards.items()}
+
+    async def set_shard_pause(self, shard_id: int, paused: bool) -> None:
+        """Sets the pause state of every player connected through a shard."""
+        for player in self.get_shard_players(shard_id):
+            if player._playing:
+                await player.set_pause(paused)
+
+    async def _on_disconnect(self) -> None:
+        await self._on_shard_disconnect(self._shard_id)
+
+    async def _on_ready(self) -> None:
+        await self._on_shard_ready(self._shard_id)
+
+    def _get_bucket(self, shard_id: int) -> TokenBucket:
+        try:
+            return self._buckets[shard_id]
+        except KeyError:
+            bucket = self._buckets[shard_id] = TokenBucket(
+                self._voice_rate, self._voice_burst
+            )
+            return bucket
+
+    async def _discord_reconnect_task(self, shard_id: int) -> None:
+        # playing players first, then the most recently active ones
+        players = sorted(
+            self.get_shard_players(shard_id),
+            key=lambda player: (not player._playing, -player._last_active),
+        )
+        bucket = self._get_bucket(shard_id)
         for player in players:
-            await self._players[player].connect(self._players[player]._channel)
-            await asyncio.sleep(1)  # 1 connection / second (gateway ratelimits = bad)
+            # voice state updates count against the gateway ratelimit
+            await bucket.acquire()
+            if player._channel is None:
+                continue  # disconnected in the meantime
+            try:
+                await player.connect(player._channel)
+            except Exception:
+                log.exception("Failed to reconnect player of guild %d", player._guild)
 
     def _get_discord_ws(
         self, shard_id
@@ -122,55 +666,64 @@ class Connection:
 
     @property
     def connected(self) -> bool:
-        if self._socket is None:
-            return False
-        else:
-            return self._socket.open
-
-    async def wait_until_ready(self) -> None:
-        """Waits indefinitely until the Lavalink connection has been established."""
-        while not self.connected:
-            await asyncio.sleep(0.01)
-
-    async def event_processor(self) -> None:
-        await self.wait_until_ready()
-        while self.connected:
-            try:
-                json = ujson.loads(await self._socket.recv())
-            except websockets.ConnectionClosed:
-                raise Disconnected("The lavalink server closed the connection.")
+        return any(node.connected for node in self._nodes)
 
-            op = json.get("op")
-
-            if op == "stats":
-                json.pop("op")
-                self.stats = json
+    @property
+    def nodes(self) -> List[Node]:
+        """Returns the node pool."""
+        return list(self._nodes)
 
-            elif op == "playerUpdate" and "position" in json["state"]:
-                player = self.get_player(int(json["guildId"]))
+    @property
+    def best_node(self) -> Optional[Node]:
+        """Returns the least loaded connected node, or None if no node is connected."""
+        return min(
+            (node for node in self._nodes if node.connected),
+            key=lambda node: node.penalty,
+            default=None,
+        )
 
-                lag = time.time() - json["state"]["time"] / 1000
-                player._position = json["state"]["position"] / 1000 + lag
+    async def wait_until_ready(self) -> None:
+        """Waits indefinitely until the Lavalink connection has been established."""
+        await self._ready.wait()
 
-            elif op == "event":
-                player = self.get_player(int(json["guildId"]))
-                self._loop.create_task(player._process_event(json))
+    def _node_for(self, player: Player) -> Node:
+        if player._node is None:
+            node = self.best_node
+            if node is None:
+                # every node is down, one that is reconnecting buffers the player's ops
+                node = min(
+                    (node for node in self._nodes if node._reconnecting),
+                    key=lambda node: len(node._buffer),
+                    default=None,
+                )
+            if node is None:
+                raise Disconnected()
+            node._assigned += 1
+            player._node = node
+        return player._node
 
     async def _send(self, **data) -> None:
-        if not self.connected:
-            raise Disconnected()
+        if self.scheduler is not None:
+            self._node_for(self.get_player(int(data["guildId"])))
+            self.scheduler.submit(data)
+        else:
+            await self._send_now(data)
 
-        try:
-            data["guildId"] = str(data["guildId"])
-            data["channelId"] = str(data["channelId"])
-        except KeyError:
-            pass
-        await self._socket.send(ujson.dumps(data))
+    async def _send_now(self, data: dict) -> None:
+        player = self.get_player(int(data["guildId"]))
+        await self._node_for(player)._send(data)
+
+    def _fast_path(self, guild_id: int) -> Tuple[Node, OpTemplates]:
+        """Returns the node and op templates to send a pre-encoded op of a guild, bypassing the scheduler."""
+        player = self.get_player(guild_id)
+        if player._templates is None:
+            player._templates = OpTemplates(guild_id)
+        return self._node_for(player), player._templates
 
     async def _discord_disconnect(self, guild_id: int) -> None:
         shard_id = (guild_id >> 22) % self._shard_count
         await self._get_discord_ws(shard_id).send(
-            ujson.dumps(
+            self.codec.dumps(
                 {
                     "op": 4,
                     "d": {
@@ -186,7 +739,7 @@ class Connection:
     async def _discord_connect(self, guild_id: int, channel_id: int) -> None:
         shard_id = (guild_id >> 22) % self._shard_count
         await self._get_discord_ws(shard_id).send(
-            ujson.dumps(
+            self.codec.dumps(
                 {
                     "op": 4,
                     "d": {
@@ -202,7 +755,16 @@ class Connection:
     async def _play(
         self, guild_id: int, track: str, start_time: float, end_time: Optional[float]
     ) -> None:
-        if end_time is not None:
+        # base64 track strings never need escaping, anything else takes the encoding path
+        if self.scheduler is None and '"' not in track and "\\" not in track:
+            node, templates = self._fast_path(guild_id)
+            start = int(start_time * 1000)
+            if end_time is not None:
+                frame = f'{templates.play}{track}","startTime":{start},"endTime":{int(end_time * 1000)}}}'
+            else:
+                frame = f'{templates.play}{track}","startTime":{start}}}'
+            await node._send_encoded("play", frame)
+        elif end_time is not None:
             await self._send(
                 op="play",
                 guildId=guild_id,
@@ -219,19 +781,149 @@ class Connection:
             )
 
     async def _pause_resume(self, guild_id: int, paused: bool) -> None:
-        await self._send(op="pause", guildId=guild_id, pause=paused)
+        if self.scheduler is None:
+            node, templates = self._fast_path(guild_id)
+            await node._send_encoded(
+                "pause", templates.pause if paused else templates.resume
+            )
+        else:
+            await self._send(op="pause", guildId=guild_id, pause=paused)
 
     async def _stop(self, guild_id: int) -> None:
-        await self._send(op="stop", guildId=guild_id)
+        if self.scheduler is None:
+            node, templates = self._fast_path(guild_id)
+            await node._send_encoded("stop", templates.stop)
+        else:
+            await self._send(op="stop", guildId=guild_id)
 
     async def _volume(self, guild_id: int, level: int) -> int:
-        level = max(min(level, 150), 0)  # no earrapes
-        await self._send(op="volume", guildId=guild_id, volume=level)
+        level = max(min(int(level), 150), 0)  # no earrapes
+        if self.scheduler is None:
+            node, templates = self._fast_path(guild_id)
+            await node._send_encoded("volume", f"{templates.volume}{level}}}")
+        else:
+            await self._send(op="volume", guildId=guild_id, volume=level)
         return level
 
     async def _seek(self, guild_id: int, position: float) -> None:
         position = int(position * 1000)
-        await self._send(op="seek", guildId=guild_id, position=position)
+        if self.scheduler is None:
+            node, templates = self._fast_path(guild_id)
+            await node._send_encoded("seek", f"{templates.seek}{position}}}")
+        else:
+            await self._send(op="seek", guildId=guild_id, position=position)
+
+    async def _equalizer(
+        self, guild_id: int, gains: List[Tuple[int, float]], bands: Optional[str] = None
+    ) -> None:
+        if self.scheduler is None:
+            node, templates = self._fast_path(guild_id)
+            if bands is None:
+                bands = encode_bands(gains)
+            await node._send_encoded("equalizer", f"{templates.equalizer}{bands}}}")
+        else:
+            await self._send(
+                op="equalizer",
+                guildId=guild_id,
+                bands=[{"band": band, "gain": gain} for band, gain in gains],
+            )
+
+    async def evict_idle_players(self, timeout: float) -> int:
+        """
+        Drops players that are disconnected, stopped, have an empty queue and did not change state for a while.
+        They are destroyed on their Lavalink node as well, so a later player of the guild starts from defaults there too.
+        :param timeout: For how many seconds a player must have been idle.
+        :return: The amount of dropped players.
+        """
+        deadline = time.monotonic() - timeout
+        idle = [
+            player for player in self._players.values() if player._evictable(deadline)
+        ]
+        for player in idle:
+            del self._players[player._guild]
+            node = player._node
+            if node is not None and node.connected:
+                try:
+                    await node._send({"op": "destroy", "guildId": player._guild})
+                except (Disconnected, websockets.ConnectionClosed):
+                    pass  # the node drops its players with the session
+        return len(idle)
+
+    async def _eviction_loop(self) -> None:
+        while True:
+            await asyncio.sleep(min(self.idle_timeout / 4, 60))
+            await self.evict_idle_players(self.idle_timeout)
+
+    async def snapshot(self, path: str) -> int:
+        """
+        Saves the track, position, volume, equalizer, queue and channel of every voice-connected player to a file.
+        :param path: The file to write the gzip compressed snapshot to.
+        :return: The amount of saved players.
+        """
+        players = [
+            player._snapshot()
+            for player in self._players.values()
+            if player._channel is not None
+        ]
+        data = gzip.compress(
+            self.codec.dumps(
+                {"version": 1, "time": time.time(), "players": players}
+            ).encode()
+        )
+
+        def write():
+            with open(path, "wb") as f:
+                f.write(data)
+
+        await self._loop.run_in_executor(None, write)
+        return len(players)
+
+    async def restore(
+        self, path: str, *, concurrency: int = 50, voice_timeout: float = 10.0
+    ) -> int:
+        """
+        Reconnects and resumes the players saved by :meth:`Connection.snapshot`.
+        Playing players come first, then paused, then idle ones, most recently active first.
+        Voice connections are paced per shard like shard reconnects, and playback resumes at the saved position plus the time since the snapshot.
+        :param path: The snapshot file.
+        :param concurrency: (optional) How many players may be waiting for their voice connection at once.
+        :param voice_timeout: (optional) How long to wait for a player's voice connection before giving up on it.
+        :return: The amount of restored players.
+        """
+
+        def read():
+            with open(path, "rb") as f:
+                return f.read()
+
+        data = self.codec.loads(
+            gzip.decompress(await self._loop.run_in_executor(None, read))
+        )
+        snapshot_time = data["time"]
+        entries = sorted(
+            data["players"],
+            key=lambda entry: ("track" not in entry, entry["paused"], entry["idle"]),
+        )
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def restore_player(entry):
+            guild_id = entry["guild"]
+            player = self.get_player(guild_id)
+            async with semaphore:
+                await self._get_bucket((guild_id >> 22) % self._shard_count).acquire()
+                waiter = self._voice_waiters[guild_id] = self._loop.create_future()
+                try:
+                    await player.connect(entry["channel"])
+                    await asyncio.wait_for(waiter, voice_timeout)
+                    await player._restore(entry, time.time() - snapshot_time)
+                except Exception:
+                    log.exception("Failed to restore player of guild %d", guild_id)
+                    return False
+                finally:
+                    self._voice_waiters.pop(guild_id, None)
+            return True
+
+        results = await asyncio.gather(*[restore_player(entry) for entry in entries])
+        return sum(results)
 
     def get_player(self, guild_id: int) -> Player:
         """
@@ -250,29 +942,152 @@ class Connection:
             self._players[guild_id] = player
         return player
 
-    async def query(self, query: str, *, retry_count=0, retry_delay=0) -> List[Track]:
+    async def query(
+        self, query: str, *, retry_count=0, retry_delay=0.5, lazy=False
+    ) -> Union[List[Track], TrackList]:
         """
         Queries Lavalink. Returns a list of Track objects (dictionaries).
+        If a :class:`QueryCache` is set, cached results are returned and concurrent identical queries share one request.
         :param query: The search query to make.
         :param retry_count: How often to retry the query should it fail. 0 disables, -1 will try forever (dangerous).
-        :param retry_delay: How long to sleep for between retries.
+        :param retry_delay: The base delay between retries. It doubles with every retry and is randomly jittered.
+        :param lazy: Return a compact :class:`TrackList` that builds Tracks on access instead. Useful for big playlists.
         """
-        headers = {"Authorization": self._password, "Accept": "application/json"}
-        params = {"identifier": query}
-        while True:
+        if self.query_cache is None:
+            return await self._load_tracks(query, retry_count, retry_delay, lazy)
+        tracks = await self.query_cache.fetch(
+            (query, lazy),
+            lambda: self._load_tracks(query, retry_count, retry_delay, lazy),
+        )
+        return tracks if lazy else list(tracks)
+
+    async def query_many(
+        self,
+        queries: Iterable[str],
+        *,
+        concurrency: int = 5,
+        timeout: Optional[float] = None,
+        **kwargs,
+    ) -> AsyncIterator[Tuple[str, Union[List[Track], Exception]]]:
+        """
+        Queries Lavalink for several identifiers in parallel.
+        Yields (query, result) pairs in input order as soon as each result is available.
+        If a query fails or times out, its result is the exception instead of a list of Tracks.
+        :param queries: The search queries to make.
+        :param concurrency: How many queries may run at the same time.
+        :param timeout: (optional) How long a single query may take before it is given up on.
+        :param kwargs: Passed to :meth:`Connection.query`.
+        """
+        queries = list(queries)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run(query):
+            async with semaphore:
+                return await asyncio.wait_for(self.query(query, **kwargs), timeout)
+
+        tasks = [self._loop.create_task(run(query)) for query in queries]
+        try:
+            for query, task in zip(queries, tasks):
+                try:
+                    result = await task
+                except Exception as e:
+                    result = e
+                yield query, result
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def _rest_node(self) -> Node:
+        nodes = sorted(
+            (node for node in self._nodes if node.connected),
+            key=lambda node: node.penalty,
+        )
+        for node in nodes:
+            if node.breaker.available:
+                return node
+        if nodes:
+            raise CircuitOpen("Every node's REST API is failing.")
+        raise Disconnected()
+
+    async def _request(self, node: Node, endpoint: str, params: dict):
+        if not node.breaker.allow():
+            raise CircuitOpen(f"{node.rest_url} is failing.")
+        headers = {"Authorization": node.password, "Accept": "application/json"}
+        if self.metrics is not None:
+            labels = node._labels + (("endpoint", endpoint),)
+            self.metrics.inc("aqualink_rest_requests_total", labels)
+            start = time.perf_counter()
+        settled = False
+        try:
             async with self.session.get(
-                f"{self._rest_url}/loadtracks", params=params, headers=headers
+                f"{node.rest_url}/{endpoint}", params=params, headers=headers
             ) as resp:
-                out = await resp.json()
+                resp.raise_for_status()
+                out = await resp.json(loads=self.codec.loads)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if self.metrics is not None:
+                self.metrics.inc("aqualink_rest_errors_total", labels)
+            settled = True
+            if _retryable(e):
+                node.breaker.failure()
+            else:
+                node.breaker.success()  # the node answered, the request was bad
+            raise
+        else:
+            settled = True
+            node.breaker.success()
+        finally:
+            if not settled:
+                # cancelled or undecodable, neither outcome says anything about the node
+                node.breaker.release()
+            if self.metrics is not None:
+                self.metrics.observe(
+                    "aqualink_rest_request_seconds", labels, time.perf_counter() - start
+                )
+        return out
+
+    async def _load_tracks(
+        self, query: str, retry_count: int, retry_delay: float, lazy: bool
+    ) -> Union[List[Track], TrackList]:
+        tracks = None
+        if self.persistent_cache is not None:
+            tracks = await self.persistent_cache.get(query)
+        if tracks is None:
+            tracks = await self._fetch_tracks(query, retry_count, retry_delay)
+            if tracks and self.persistent_cache is not None:
+                await self.persistent_cache.put(query, tracks)
+        if lazy:
+            return TrackList(tracks)
+        return [Track(**data) for data in tracks]
+
+    async def _fetch_tracks(
+        self, query: str, retry_count: int, retry_delay: float
+    ) -> List[dict]:
+        params = {"identifier": query}
+        attempt = 0
+        while True:
+            node = self._rest_node()
+            try:
+                out = await self._request(node, "loadtracks", params)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if not retry_count or not _retryable(e):
+                    raise
+            else:
+                # an empty body is an edge case where lavalink just returns nothing
+                if out or not retry_count:
+                    break
 
             # -1 is not recommended unless you run it as a task which you cancel after a specific time, but
             # you do you devs
-            if not out and (
-                retry_count > 0 or retry_count < 0
-            ):  # edge case where lavalink just returns nothing
-                retry_count -= 1
-                if retry_delay:
-                    await asyncio.sleep(retry_delay)
-            else:
-                break
-        return [Track(**data) for data in out["tracks"]]
+            retry_count -= 1
+            delay = min(retry_delay * 2**attempt, 30.0)
+            attempt += 1
+            if delay:
+                await asyncio.sleep(random.uniform(0, delay))
+        return out["tracks"] if out else []
+
+
+def _retryable(error: Exception) -> bool:
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status >= 500 or error.status == 429
+    return True
@@ -1,7 +1,30 @@
+from .templates import encode_bands
+
+
+class EqualizerPreset(tuple):
+    """
+    A premade tuple of (band, gain) pairs for :meth:`Player.set_eq`.
+    Gains are clamped like :meth:`Player.set_gains` does and the equalizer op's bands are encoded
+    once here, so applying the preset does not encode them again.
+    """
+
+    def __new__(cls, gains):
+        preset = super().__new__(
+            cls,
+            (
+                (band, max(min(float(gain), 1.0), -0.25))
+                for band, gain in gains
+                if 0 <= band < 15
+            ),
+        )
+        preset.bands = encode_bands(preset)
+        return preset
+
+
 class Equalizer:
     def __init__(self, **options):
         for k, v in options.items():
-            setattr(self, k, v)
+            setattr(self, k, EqualizerPreset(v))
 
     @classmethod
     def bassboost(cls):
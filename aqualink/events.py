@@ -0,0 +1,216 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from inspect import Parameter, isawaitable, signature
+from typing import Callable
+
+log = logging.getLogger(__name__)
+
+EVENT_TYPES = (
+    "TrackStartEvent",
+    "TrackEndEvent",
+    "TrackExceptionEvent",
+    "TrackStuckEvent",
+    "WebSocketClosedEvent",
+)
+
+
+def compile_callback(callback: Callable) -> Callable:
+    """
+    Introspects a callback once and returns a function that calls it with the arguments it asks for.
+    The returned function takes the player and the raw event and returns the callback's result.
+    Parameters named "player" receive the player, "event" receives the raw event dictionary and
+    any other parameter receives the event key of the same name (e.g. "reason" or "thresholdMs").
+    Parameters with a default (including ones bound by :func:`functools.partial`) keep it unless
+    the event has that key, parameters without one receive None then.
+    """
+    required = []
+    optional = []
+    for name, param in signature(callback).parameters.items():
+        if param.kind in (Parameter.VAR_POSITIONAL, Parameter.VAR_KEYWORD):
+            continue
+        if name in ("player", "event") or param.default is Parameter.empty:
+            required.append(name)
+        else:
+            optional.append(name)
+
+    if not optional:
+        if not required:
+            return lambda player, data: callback()
+        if required == ["player"]:
+            return lambda player, data: callback(player=player)
+        if required == ["player", "reason"]:
+            return lambda player, data: callback(
+                player=player, reason=data.get("reason")
+            )
+
+    def call(player, data):
+        kwargs = {}
+        for name in required:
+            if name == "player":
+                kwargs[name] = player
+            elif name == "event":
+                kwargs[name] = data
+            else:
+                kwargs[name] = data.get(name)
+        for name in optional:
+            if name in data:
+                kwargs[name] = data[name]
+        return callback(**kwargs)
+
+    return call
+
+
+async def dispatch(listeners, player, data) -> None:
+    """Calls compiled listeners, logging instead of propagating their exceptions."""
+    watchdog = player.connection.watchdog
+    for callback, call in listeners:
+        start = (
+            time.perf_counter() if watchdog is not None and watchdog.sample() else None
+        )
+        try:
+            out = call(player, data)
+            if isawaitable(out):
+                await out
+        except Exception:
+            log.exception(
+                "Ignoring exception in %s listener %r", data["type"], callback
+            )
+        if start is not None:
+            watchdog.check_callback(
+                callback, player._guild, time.perf_counter() - start
+            )
+
+
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest", "block")
+
+
+class EventDispatcher:
+    """
+    Runs player events in order per guild, with a bounded mailbox per guild and a global concurrency cap.
+    A fixed set of workers takes turns over the guilds that have queued events, so a guild never runs
+    two events at once and a slow callback only holds up its own guild.
+    :param connection: The :class:`Connection` the events come from.
+    :param concurrency: How many events (of different guilds) may be processed at once.
+    :param max_queued: How many events a guild may have waiting before the overflow policy applies.
+    :param overflow: "drop_oldest" discards the guild's oldest waiting event, "drop_newest" discards the
+        incoming one and "block" stops reading the node's websocket until the guild has room again.
+    """
+
+    def __init__(
+        self,
+        connection,
+        concurrency: int = 100,
+        max_queued: int = 100,
+        overflow: str = "drop_oldest",
+    ) -> None:
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy {overflow}")
+        self.connection = connection
+        self.concurrency = concurrency
+        self.max_queued = max_queued
+        self.overflow = overflow
+        self.processed = 0
+        self.dropped = 0
+        # guild id -> deque of (player, event), present while scheduled
+        self._mailboxes = {}
+        self._waiters = {}  # guild id -> futures of blocked producers
+        self._ready = None  # asyncio.Queue of guild ids, created with the workers
+        self._workers = []
+
+    @property
+    def depth(self) -> int:
+        """Returns how many events are waiting over all guilds."""
+        return sum(len(mailbox) for mailbox in self._mailboxes.values())
+
+    def depth_of(self, guild_id: int) -> int:
+        """Returns how many events of a guild are waiting."""
+        mailbox = self._mailboxes.get(guild_id)
+        return len(mailbox) if mailbox is not None else 0
+
+    async def put(self, player, data: dict) -> None:
+        """Queues an event for the player's guild, applying the overflow policy if its mailbox is full."""
+        if self._ready is None:
+            self._start()
+        guild_id = player._guild
+        mailbox = self._mailboxes.get(guild_id)
+        if mailbox is None:
+            self._mailboxes[guild_id] = deque(((player, data),))
+            self._ready.put_nowait(guild_id)
+            return
+
+        while len(mailbox) >= self.max_queued:
+            if self.overflow == "drop_newest":
+                self._drop(data)
+                return
+            if self.overflow == "drop_oldest":
+                self._drop(mailbox.popleft()[1])
+                break
+            waiter = self.connection._loop.create_future()
+            self._waiters.setdefault(guild_id, deque()).append(waiter)
+            await waiter
+            if self._ready is None:
+                return  # closed while waiting
+            mailbox = self._mailboxes.get(guild_id)
+            if mailbox is None:
+                self._mailboxes[guild_id] = deque(((player, data),))
+                self._ready.put_nowait(guild_id)
+                return
+        mailbox.append((player, data))
+
+    def close(self) -> None:
+        """Stops the workers. Waiting events are discarded and blocked producers are released."""
+        for worker in self._workers:
+            worker.cancel()
+        self._workers = []
+        self._ready = None
+        self._mailboxes.clear()
+        for waiters in self._waiters.values():
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(None)
+        self._waiters.clear()
+
+    def _start(self) -> None:
+        loop = self.connection._loop
+        self._ready = asyncio.Queue()
+        self._workers = [
+            loop.create_task(self._work(self._ready)) for _ in range(self.concurrency)
+        ]
+
+    def _drop(self, data: dict) -> None:
+        self.dropped += 1
+        log.warning(
+            "Dropped %s of guild %s, its event mailbox is full",
+            data.get("type"),
+            data.get("guildId"),
+        )
+
+    async def _work(self, ready: asyncio.Queue) -> None:
+        while True:
+            guild_id = await ready.get()
+            mailbox = self._mailboxes[guild_id]
+            player, data = mailbox.popleft()
+            waiters = self._waiters.get(guild_id)
+            if waiters:
+                waiter = waiters.popleft()
+                if not waiters:
+                    del self._waiters[guild_id]
+                if not waiter.done():
+                    waiter.set_result(None)
+
+            try:
+                await player._process_event(data)
+            except Exception:
+                log.exception(
+                    "Ignoring exception while processing %s of guild %s",
+                    data.get("type"),
+                    guild_id,
+                )
+            self.processed += 1
+
+            if mailbox:
+                ready.put_nowait(guild_id)
+            else:
+                del self._mailboxes[guild_id]
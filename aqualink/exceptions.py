@@ -4,3 +4,7 @@ class Disconnected(Exception):
 
 class TrackNotFound(Exception):
     pass
+
+
+class CircuitOpen(Exception):
+    pass
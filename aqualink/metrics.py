@@ -0,0 +1,125 @@
+from bisect import bisect_left
+from typing import Dict, Tuple
+
+Labels = Tuple[Tuple[str, str], ...]
+
+HELP = {
+    "aqualink_frames_total": ("counter", "Websocket frames received from Lavalink."),
+    "aqualink_events_total": ("counter", "Player events received from Lavalink."),
+    "aqualink_ops_total": ("counter", "Ops sent to Lavalink."),
+    "aqualink_op_failures_total": ("counter", "Ops that could not be sent."),
+    "aqualink_reconnects_total": ("counter", "Websocket reconnects to Lavalink."),
+    "aqualink_rest_requests_total": ("counter", "REST requests made to Lavalink."),
+    "aqualink_rest_errors_total": ("counter", "REST requests that failed."),
+    "aqualink_rest_request_seconds": ("histogram", "REST request latency."),
+    "aqualink_loop_lag_seconds": (
+        "histogram",
+        "Event loop lag measured by the watchdog.",
+    ),
+    "aqualink_players": ("gauge", "Players known to aqualink."),
+    "aqualink_connected_players": ("gauge", "Players connected to a voice channel."),
+    "aqualink_node_connected": ("gauge", "Whether a node's websocket is open."),
+    "aqualink_node_penalty": ("gauge", "A node's load balancing penalty."),
+    "aqualink_query_cache": ("gauge", "Query cache counters."),
+    "aqualink_event_dispatcher": ("gauge", "Player event queue depth and counters."),
+}
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format(name: str, labels: Labels, value) -> str:
+    if labels:
+        label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+        return f"{name}{{{label_text}}} {value}"
+    return f"{name} {value}"
+
+
+def _numeric(value) -> bool:
+    # e.g. "frameStats" is null until a node has played something
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class Metrics:
+    """
+    An opt-in registry of counters and latency histograms for a :class:`Connection`.
+    Enable it with ``Connection(bot, metrics=True)`` and export it with :meth:`Metrics.render`.
+    """
+
+    def __init__(self, connection) -> None:
+        self.connection = connection
+        self.counters = {}  # type: Dict[Tuple[str, Labels], float]
+        self.histograms = {}  # type: Dict[Tuple[str, Labels], list]
+
+    def inc(self, name: str, labels: Labels = (), value: float = 1) -> None:
+        """Increments a counter."""
+        key = (name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, labels: Labels, value: float) -> None:
+        """Records a value (usually seconds) in a histogram."""
+        key = (name, labels)
+        try:
+            histogram = self.histograms[key]
+        except KeyError:
+            # one slot per bucket, +Inf, then the sum
+            histogram = self.histograms[key] = [0] * (len(BUCKETS) + 2)
+        histogram[bisect_left(BUCKETS, value)] += 1
+        histogram[-1] += value
+
+    def _gauges(self):
+        connection = self.connection
+        yield "aqualink_players", (), len(connection._players)
+        yield "aqualink_connected_players", (), sum(
+            1 for player in connection._players.values() if player.connected
+        )
+        for node in connection._nodes:
+            labels = (("node", node.ws_url),)
+            yield "aqualink_node_connected", labels, int(node.connected)
+            yield "aqualink_node_penalty", labels, node.penalty
+            for key, value in (node.stats or {}).items():
+                if isinstance(value, dict):
+                    for subkey, subvalue in value.items():
+                        if _numeric(subvalue):
+                            yield f"lavalink_{key}_{subkey}", labels, subvalue
+                elif _numeric(value):
+                    yield f"lavalink_{key}", labels, value
+        cache = connection.query_cache
+        if cache is not None:
+            for key in ("hits", "misses", "evictions", "coalesced"):
+                yield "aqualink_query_cache", (("counter", key),), getattr(cache, key)
+            yield "aqualink_query_cache", (("counter", "size"),), len(cache)
+        dispatcher = connection.dispatcher
+        for key in ("depth", "processed", "dropped"):
+            yield "aqualink_event_dispatcher", (("counter", key),), getattr(
+                dispatcher, key
+            )
+
+    def render(self) -> str:
+        """Renders all metrics and the latest Lavalink stats in the Prometheus text exposition format."""
+        families = {}
+        for (name, labels), value in self.counters.items():
+            families.setdefault(name, []).append(_format(name, labels, value))
+        for (name, labels), histogram in self.histograms.items():
+            lines = families.setdefault(name, [])
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ("+Inf",), histogram):
+                cumulative += count
+                lines.append(
+                    _format(f"{name}_bucket", labels + (("le", bound),), cumulative)
+                )
+            lines.append(_format(f"{name}_sum", labels, histogram[-1]))
+            lines.append(_format(f"{name}_count", labels, cumulative))
+        for name, labels, value in self._gauges():
+            families.setdefault(name, []).append(_format(name, labels, value))
+
+        out = []
+        for name, lines in families.items():
+            kind, text = HELP.get(name, ("gauge", "Lavalink node statistic."))
+            out.append(f"# HELP {name} {text}")
+            out.append(f"# TYPE {name} {kind}")
+            out.extend(lines)
+        return "\n".join(out) + "\n"
@@ -1,5 +1,11 @@
-from inspect import isawaitable, signature
-from typing import Optional, Callable, List
+import time
+from array import array
+from inspect import isawaitable
+from typing import AsyncIterator, Optional, Callable, List
+from .eq import EqualizerPreset
+from .events import compile_callback, dispatch
+from .positions import PositionUpdate
+from .queue import Queue
 from .track import Track
 
 try:
@@ -11,19 +17,33 @@ except ImportError:
         raise ImportError("You don't have discord.py or discord.jspy installed!")
 
 
+# shared by every player with a flat equalizer, copied on the first change
+FLAT_EQUALIZER = array("d", [0.0] * 15)
+FLAT_PRESET = EqualizerPreset((band, 0.0) for band in range(15))
+
+
 class Player:
     __slots__ = (
         "connection",
         "track",
-        "equalizer",
+        "_equalizer",
         "_guild",
         "_channel",
         "_paused",
         "_playing",
         "_position",
+        "_position_time",
         "_volume",
         "_track_callback",
+        "_track_dispatch",
         "_connecting",
+        "_node",
+        "_voice_state",
+        "_session_id",
+        "_voice_server",
+        "_queue",
+        "_last_active",
+        "_templates",
     )
 
     def __init__(self, connection, guild_id: int) -> None:
@@ -35,9 +55,18 @@ class Player:
         self._paused = False
         self._playing = False
         self._position = None
+        self._position_time = 0.0
         self._volume = 100
         self._track_callback = None
-        self.equalizer = [0.0 for x in range(15)]
+        self._track_dispatch = None
+        self._node = None
+        self._voice_state = None
+        self._session_id = None
+        self._voice_server = None  # a VOICE_SERVER_UPDATE waiting for its voice state
+        self._queue = None
+        self._last_active = time.monotonic()
+        self._equalizer = FLAT_EQUALIZER
+        self._templates = None  # OpTemplates, built on the first fast path op
 
     @property
     def channel(self) -> Optional[VoiceChannel]:
@@ -51,6 +80,11 @@ class Player:
         """Returns the player's guild."""
         return self.connection.bot.get_guild(self._guild)
 
+    @property
+    def node(self):
+        """Returns the Lavalink node the player is assigned to, if any."""
+        return self._node
+
     @property
     def connected(self) -> bool:
         """Returns the player's connected state."""
@@ -58,8 +92,28 @@ class Player:
 
     @property
     def position(self) -> Optional[float]:
-        """Returns the player's current position in seconds."""
-        return self._position
+        """
+        Returns the player's current position in seconds.
+        Between Lavalink's position updates it is extrapolated with a monotonic clock while playing.
+        """
+        if self._position is None:
+            return None
+        if not self._playing or self._paused:
+            return self._position
+        position = self._position + time.monotonic() - self._position_time
+        if self.track is not None and self.track.length and not self.track.stream:
+            return min(position, self.track.length / 1000)
+        return position
+
+    @property
+    def equalizer(self) -> List[float]:
+        """Returns a copy of the player's 15 equalizer band gains."""
+        return list(self._equalizer)
+
+    @property
+    def idle(self) -> float:
+        """Returns for how many seconds the player's state has not changed."""
+        return time.monotonic() - self._last_active
 
     @property
     def paused(self) -> bool:
@@ -83,33 +137,66 @@ class Player:
         """Returns the player's volume."""
         return self._volume
 
+    @property
+    def queue(self) -> Queue:
+        """Returns the player's :class:`Queue`. When a track finishes, the next queued track is played automatically."""
+        if self._queue is None:
+            self._queue = Queue(self)
+        return self._queue
+
     @property
     def track_callback(self) -> Optional[Callable]:
         """Accesses the track callback.
         This is the callable that will be called with the current player's instance as its first argument.
         It may be awaitable. If it is None, it will be ignored.
+        The callback's signature is inspected once here, see :func:`compile_callback`.
         """
         return self._track_callback
 
     @track_callback.setter
     def track_callback(self, c: Optional[Callable]) -> None:
         self._track_callback = c
+        self._track_dispatch = compile_callback(c) if c is not None else None
 
     async def connect(self, channel_id: int) -> None:
         """Connects the player to a Discord channel."""
         self._connecting = True
+        # wait for this connection's voice state instead of pairing with an older session
+        self._session_id = None
+        self._voice_server = None
         await self.connection._discord_connect(self._guild, channel_id)
         self._channel = channel_id
+        self.connection._index_player(self)
 
     async def disconnect(self) -> None:
         """Disconnects the player from Discord."""
         await self.connection._discord_disconnect(self._guild)
         self._channel = None
+        # the Discord voice session ended, it must not be replayed to Lavalink
+        self._voice_state = None
+        self._session_id = None
+        self._voice_server = None
+        self._connecting = False
+        self.connection._index_player(self)
+        self._last_active = time.monotonic()
 
     async def query(self, *args, **kwargs) -> List[Track]:
         """Shortcut method for :meth:`Connection.query`."""
         return await self.connection.query(*args, **kwargs)
 
+    def query_many(self, *args, **kwargs):
+        """Shortcut method for :meth:`Connection.query_many`."""
+        return self.connection.query_many(*args, **kwargs)
+
+    def position_updates(self, interval: float = 1.0) -> AsyncIterator[PositionUpdate]:
+        """
+        Returns an async iterator of the player's :class:`PositionUpdate` at most once per interval.
+        All subscriptions of a connection share one task, see :class:`PositionHub`.
+        Stopped and paused players only yield again once their state changes.
+        :param interval: (optional) The minimum time between two updates in seconds (defaults to 1).
+        """
+        return self.connection.position_hub.subscribe(self, interval)
+
     async def play(
         self, track: Track, start_time: float = 0.0, end_time: float = None
     ) -> None:
@@ -122,12 +209,30 @@ class Player:
         await self.connection._play(self._guild, track.track, start_time, end_time)
         self._playing = True
         self.track = track
+        self._set_position(start_time)
+        self._last_active = time.monotonic()
+
+    async def play_next(self) -> Optional[Track]:
+        """
+        Plays the next track of the queue, replacing the current one.
+        If the queue is empty, the player is stopped instead.
+        :return: The track that is now playing, or None.
+        """
+        track = await self._queue.get() if self._queue is not None else None
+        if track is None:
+            if self._playing:
+                await self.stop()
+            return None
+        await self.play(track)
+        return track
 
     async def set_pause(self, paused: bool) -> None:
         """Sets the pause state."""
         if paused == self._paused:
             return
         await self.connection._pause_resume(self._guild, paused)
+        if self._position is not None:
+            self._set_position(self.position)
         self._paused = paused
 
     async def set_volume(self, volume: int) -> None:
@@ -141,18 +246,25 @@ class Player:
         """Stops the player."""
         await self.connection._stop(self._guild)
         self._playing = False
+        self._last_active = time.monotonic()
 
     async def seek(self, position: float) -> None:
         """Seeks to a specific position in a track."""
         await self.connection._seek(self._guild, position)
+        if self._position is not None:
+            self._set_position(position)
 
     async def set_gain(self, band: int, gain: float = 0.0) -> None:
         """Sets the equalizer gain."""
         await self.set_gains((band, gain))
 
     async def set_eq(self, gain_list):
-        """Use a premade Equalizer."""
-        await self.set_gains(*gain_list)
+        """Use a premade Equalizer. An :class:`EqualizerPreset` is sent with its pre-encoded bands."""
+        if not isinstance(gain_list, EqualizerPreset):
+            await self.set_gains(*gain_list)
+            return
+        self._apply_gains(gain_list)
+        await self.connection._equalizer(self._guild, gain_list, gain_list.bands)
 
     async def set_gains(self, *gain_list) -> None:
         """Modifies the player's equalizer settings."""
@@ -164,43 +276,153 @@ class Player:
             band = value[0]
             gain = value[1]
 
-            if -1 > value[0] > 15:
+            if not 0 <= band < 15:
                 continue
 
-            gain = max(min(float(gain), 1.0), -0.25)
-            update_package.append({"band": band, "gain": gain})
-            self.equalizer[band] = gain
+            update_package.append((band, max(min(float(gain), 1.0), -0.25)))
 
-        await self.connection._send(
-            op="equalizer", guildId=self._guild, bands=update_package
-        )
+        self._apply_gains(update_package)
+        await self.connection._equalizer(self._guild, update_package)
+
+    def _apply_gains(self, gains) -> None:
+        for band, gain in gains:
+            if self._equalizer is FLAT_EQUALIZER:
+                self._equalizer = array("d", FLAT_EQUALIZER)
+            self._equalizer[band] = gain
+
+        if not any(self._equalizer):
+            self._equalizer = FLAT_EQUALIZER
 
     async def reset_equalizer(self) -> None:
         """Resets equalizer to default values."""
-        await self.set_gains(*[(x, 0.0) for x in range(15)])
+        await self.set_eq(FLAT_PRESET)
+
+    def _snapshot(self) -> dict:
+        """Returns the player's state as a plain dictionary, see :meth:`Connection.snapshot`."""
+        entry = {
+            "guild": self._guild,
+            "channel": self._channel,
+            "volume": self._volume,
+            "paused": self._paused,
+            "idle": self.idle,
+        }
+        if self._equalizer is not FLAT_EQUALIZER:
+            entry["equalizer"] = list(self._equalizer)
+        if self._playing and self.track is not None:
+            entry["track"] = self.track.track
+            entry["position"] = self.position or 0.0
+        if self._queue:
+            entry["queue"] = [
+                item.track if isinstance(item, Track) else {"query": item}
+                for item in self._queue
+            ]
+        return entry
+
+    async def _restore(self, entry: dict, elapsed: float) -> None:
+        """Applies a state returned by :meth:`Player._snapshot` once the player is connected again."""
+        if entry["volume"] != 100:
+            await self.set_volume(entry["volume"])
+        if "equalizer" in entry:
+            await self.set_gains(
+                *[(b, g) for b, g in enumerate(entry["equalizer"]) if g]
+            )
+        if "queue" in entry:
+            self.queue.add(
+                *[
+                    Track.from_blob(item) if isinstance(item, str) else item["query"]
+                    for item in entry["queue"]
+                ]
+            )
+        if "track" in entry:
+            paused = entry["paused"]
+            position = entry["position"] if paused else entry["position"] + elapsed
+            track = Track.from_blob(entry["track"])
+            # paused players start paused instead of playing for a moment first
+            await self.connection._send(
+                op="play",
+                guildId=self._guild,
+                track=track.track,
+                startTime=int(position * 1000),
+                pause=paused,
+            )
+            self._playing = True
+            self._paused = paused
+            self.track = track
+            self._set_position(position)
+            self._last_active = time.monotonic()
+
+    def _set_position(self, position: float) -> None:
+        self._position = position
+        self._position_time = time.monotonic()
+
+    def _evictable(self, deadline: float) -> bool:
+        return (
+            self._last_active < deadline
+            and self._channel is None
+            and not self._connecting
+            and not self._playing
+            and not self._queue
+        )
+
+    def _state_ops(self) -> List[dict]:
+        """Returns the ops that rebuild this player's state on a fresh Lavalink session."""
+        if self._voice_state is None or self._channel is None:
+            return []
+
+        ops = [dict(self._voice_state)]
+        if self._volume != 100:
+            ops.append({"op": "volume", "guildId": self._guild, "volume": self._volume})
+        bands = [{"band": b, "gain": g} for b, g in enumerate(self._equalizer) if g]
+        if bands:
+            ops.append({"op": "equalizer", "guildId": self._guild, "bands": bands})
+        if self._playing and self.track is not None:
+            ops.append(
+                {
+                    "op": "play",
+                    "guildId": self._guild,
+                    "track": self.track.track,
+                    "startTime": int((self.position or 0.0) * 1000),
+                    "pause": self._paused,
+                }
+            )
+        return ops
 
     async def _process_event(self, data) -> None:
         if data["op"] != "event":
             return
 
-        if data["type"] != "TrackEndEvent":
+        event = data["type"]
+        listeners = self.connection._listeners.get(event)
+
+        if event != "TrackEndEvent":
+            if listeners:
+                await dispatch(listeners, self, data)
             return
 
-        self._playing = False
-        self._position = None
-        self.track = None
+        if data.get("reason") != "REPLACED":
+            # a replaced track's end event arrives after the new track started
+            self._playing = False
+            self._position = None
+            self.track = None
+            self._last_active = time.monotonic()
 
-        if not self.track_callback:
-            return
+        if self._queue and data.get("reason") in ("FINISHED", "LOAD_FAILED"):
+            await self.play_next()
+
+        if listeners:
+            await dispatch(listeners, self, data)
 
-        kwargs = {}
-        sig = signature(self.track_callback)
-        if sig:
-            if "player" in sig.parameters:
-                kwargs["player"] = self
-            if "reason" in sig.parameters:
-                kwargs["reason"] = data.get("reason")
+        if self._track_dispatch is None:
+            return
 
-        out = self.track_callback(**kwargs)
+        watchdog = self.connection.watchdog
+        start = (
+            time.perf_counter() if watchdog is not None and watchdog.sample() else None
+        )
+        out = self._track_dispatch(self, data)
         if isawaitable(out):
             await out
+        if start is not None:
+            watchdog.check_callback(
+                self._track_callback, self._guild, time.perf_counter() - start
+            )
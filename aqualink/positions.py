@@ -0,0 +1,115 @@
+import asyncio
+import time
+from heapq import heappop, heappush
+from typing import AsyncIterator, NamedTuple, Optional
+
+from .track import Track
+
+
+def _wake(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class PositionUpdate(NamedTuple):
+    """A player's playback state at one moment, yielded by :meth:`Player.position_updates`."""
+
+    track: Optional[Track]
+    position: Optional[float]
+    playing: bool
+    paused: bool
+
+
+class _Subscription:
+
+    __slots__ = ("player", "interval", "value", "last", "waiter", "closed")
+
+    def __init__(self, player, interval: float) -> None:
+        self.player = player
+        self.interval = interval
+        self.value = None
+        self.last = None
+        self.waiter = None
+        self.closed = False
+
+    def deliver(self) -> None:
+        player = self.player
+        update = PositionUpdate(
+            player.track, player.position, player.playing, player.paused
+        )
+        if update == self.last and not update.playing:
+            return  # nothing moved since the last update
+        self.last = self.value = update
+        if self.waiter is not None:
+            _wake(self.waiter)
+
+    async def next(self) -> PositionUpdate:
+        while self.value is None:
+            self.waiter = self.player.connection._loop.create_future()
+            await self.waiter
+        value, self.value = self.value, None
+        return value
+
+
+class PositionHub:
+    """
+    Delivers throttled :class:`PositionUpdate` streams for any number of players from a single task.
+    Subscriptions are kept in a heap ordered by their next due time, so the task only wakes when one
+    is due. A subscriber that falls behind skips to the latest update instead of building a backlog.
+    :param connection: The :class:`Connection` whose players are subscribed to.
+    """
+
+    def __init__(self, connection) -> None:
+        self.connection = connection
+        self.subscribers = 0
+        self._heap = []  # (due, sequence, subscription)
+        self._sequence = 0
+        self._task = None
+        self._wakeup = None
+
+    async def subscribe(self, player, interval: float) -> AsyncIterator[PositionUpdate]:
+        """Yields the player's state at most once per interval (in seconds) until the caller stops iterating."""
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        subscription = _Subscription(player, interval)
+        self._push(time.monotonic(), subscription)
+        self.subscribers += 1
+        if self._task is None or self._task.done():
+            self._task = self.connection._loop.create_task(self._run())
+        try:
+            while True:
+                yield await subscription.next()
+        finally:
+            subscription.closed = True
+            self.subscribers -= 1
+
+    def _push(self, due: float, subscription: _Subscription) -> None:
+        self._sequence += 1
+        heappush(self._heap, (due, self._sequence, subscription))
+        if self._heap[0][2] is subscription and self._wakeup is not None:
+            _wake(self._wakeup)
+
+    async def _run(self) -> None:
+        loop = self.connection._loop
+        heap = self._heap
+        while True:
+            now = time.monotonic()
+            while heap and heap[0][0] <= now:
+                due, _, subscription = heappop(heap)
+                if subscription.closed:
+                    continue
+                subscription.deliver()
+                due += subscription.interval
+                if due <= now:
+                    due = now + subscription.interval  # fell behind, skip missed ticks
+                self._sequence += 1
+                heappush(heap, (due, self._sequence, subscription))
+
+            self._wakeup = waiter = loop.create_future()
+            if heap:
+                handle = loop.call_later(heap[0][0] - now, _wake, waiter)
+                await waiter
+                handle.cancel()
+            else:
+                await waiter
+            self._wakeup = None
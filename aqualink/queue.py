@@ -0,0 +1,115 @@
+import random
+from collections import deque
+from typing import Iterator, Optional, Union
+from .track import Track
+
+
+def _consume(task) -> None:
+    if not task.cancelled():
+        task.exception()
+
+
+class Queue:
+    """
+    A deque-backed track queue of a :class:`Player`.
+    Entries may be Tracks or search strings. The string at the head of the queue is resolved
+    ahead of time, so the next track can be played as soon as the current one ends.
+    """
+
+    __slots__ = ("player", "_entries", "_prefetch")
+
+    def __init__(self, player) -> None:
+        self.player = player
+        self._entries = deque()
+        self._prefetch = None  # (query, task) of the resolving head entry
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self) -> Iterator[Union[Track, str]]:
+        return iter(self._entries)
+
+    def __getitem__(self, index: int) -> Union[Track, str]:
+        return self._entries[index]
+
+    def __repr__(self):
+        return f"<Queue length={len(self)}>"
+
+    def add(self, *items: Union[Track, str], front: bool = False) -> None:
+        """
+        Adds Tracks or search strings to the queue.
+        :param items: The Tracks or search strings to add.
+        :param front: (optional) Whether to add them to the front of the queue instead of the end.
+        """
+        if front:
+            self._entries.extendleft(reversed(items))
+        else:
+            self._entries.extend(items)
+        self._prefetch_next()
+
+    def remove(self, index: int) -> Union[Track, str]:
+        """Removes and returns the entry at the given index."""
+        item = self._entries[index]
+        del self._entries[index]
+        self._prefetch_next()
+        return item
+
+    def move(self, index: int, new_index: int) -> None:
+        """Moves the entry at index to new_index."""
+        item = self._entries[index]
+        del self._entries[index]
+        self._entries.insert(new_index, item)
+        self._prefetch_next()
+
+    def shuffle(self) -> None:
+        """Shuffles the queue."""
+        entries = list(self._entries)
+        random.shuffle(entries)
+        self._entries = deque(entries)
+        self._prefetch_next()
+
+    def clear(self) -> None:
+        """Removes all entries from the queue."""
+        self._entries.clear()
+        self._prefetch_next()
+
+    async def get(self) -> Optional[Track]:
+        """
+        Removes and returns the next Track, resolving it first if it is a search string.
+        Search strings without results are skipped. Returns None if the queue is empty.
+        """
+        while self._entries:
+            item = self._entries.popleft()
+            if isinstance(item, str):
+                task = self._take(item)
+                self._prefetch_next()
+                try:
+                    tracks = await task
+                except Exception:
+                    continue
+                if not tracks:
+                    continue
+                item = tracks[0]
+            else:
+                self._prefetch_next()
+            return item
+        return None
+
+    def _take(self, query: str):
+        if self._prefetch is not None and self._prefetch[0] == query:
+            task = self._prefetch[1]
+            self._prefetch = None
+            return task
+        return self.player.connection._loop.create_task(self.player.query(query))
+
+    def _prefetch_next(self) -> None:
+        head = self._entries[0] if self._entries else None
+        if self._prefetch is not None:
+            if self._prefetch[0] == head:
+                return
+            # the result may still warm a query cache, so let it finish
+            self._prefetch[1].add_done_callback(_consume)
+            self._prefetch = None
+        if isinstance(head, str):
+            task = self.player.connection._loop.create_task(self.player.query(head))
+            self._prefetch = (head, task)
@@ -0,0 +1,37 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """
+    Paces actions to a sustained rate while allowing short bursts.
+    :param rate: How many actions per second may be taken on average.
+    :param capacity: How many actions may be taken at once after being idle.
+    """
+
+    __slots__ = ("rate", "capacity", "_tokens", "_updated")
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    @property
+    def tokens(self) -> float:
+        """Returns how many actions may be taken right now."""
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+        return self._tokens
+
+    async def acquire(self) -> None:
+        """Waits until an action may be taken and uses up its token."""
+        while True:
+            tokens = self.tokens
+            if tokens >= 1:
+                self._tokens = tokens - 1
+                return
+            await asyncio.sleep((1 - tokens) / self.rate)
@@ -0,0 +1,59 @@
+import time
+
+
+class CircuitBreaker:
+    """
+    Tracks the health of a node's REST API.
+    After threshold consecutive failures the circuit opens and requests fail fast. Once the cooldown
+    has passed, a single trial request is let through; its outcome closes or reopens the circuit.
+    :param threshold: How many consecutive failures open the circuit.
+    :param cooldown: How long (in seconds) the circuit stays open before a trial request.
+    """
+
+    __slots__ = ("threshold", "cooldown", "failures", "_opened_at", "_trial")
+
+    def __init__(self, threshold: int = 5, cooldown: float = 30.0) -> None:
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self._opened_at = None
+        self._trial = False
+
+    @property
+    def state(self) -> str:
+        """Returns "closed", "open" or "half-open"."""
+        if self._opened_at is None:
+            return "closed"
+        if self._trial or time.monotonic() - self._opened_at >= self.cooldown:
+            return "half-open"
+        return "open"
+
+    @property
+    def available(self) -> bool:
+        """Returns whether a request would currently be allowed."""
+        if self._opened_at is None:
+            return True
+        return not self._trial and time.monotonic() - self._opened_at >= self.cooldown
+
+    def allow(self) -> bool:
+        """Returns whether a request may be made now and claims the trial request if half-open."""
+        if not self.available:
+            return False
+        if self._opened_at is not None:
+            self._trial = True
+        return True
+
+    def release(self) -> None:
+        """Gives up a claimed trial request that ended without an outcome, e.g. because it was cancelled."""
+        self._trial = False
+
+    def success(self) -> None:
+        self.failures = 0
+        self._opened_at = None
+        self._trial = False
+
+    def failure(self) -> None:
+        self.failures += 1
+        self._trial = False
+        if self._opened_at is not None or self.failures >= self.threshold:
+            self._opened_at = time.monotonic()
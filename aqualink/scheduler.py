@@ -0,0 +1,81 @@
+import asyncio
+import logging
+from .exceptions import Disconnected
+
+log = logging.getLogger(__name__)
+
+
+class SendScheduler:
+    """
+    Collects outbound ops for a short window and collapses superseded ones before sending.
+    Within a window, repeated volume, seek, equalizer and pause ops of a guild are reduced to
+    the latest value (equalizer bands are merged). Any other op, such as play or stop, is sent
+    in order and keeps earlier ops from being collapsed with later ones.
+    :param connection: The :class:`Connection` to send through.
+    :param window: How long (in seconds) ops are collected before they are sent.
+    """
+
+    COALESCED = frozenset(("volume", "seek", "equalizer", "pause"))
+
+    def __init__(self, connection, window: float = 0.05) -> None:
+        self.connection = connection
+        self.window = window
+        self.sent = 0
+        self.coalesced = 0
+        self._pending = {}  # guild_id -> [op, ...]
+        # guild_id -> {op name: index in pending} since the last barrier
+        self._latest = {}
+        self._handle = None
+        self._lock = asyncio.Lock()
+
+    def submit(self, data: dict) -> None:
+        """Queues an op to be sent at the end of the current window."""
+        guild_id = int(data["guildId"])
+        ops = self._pending.get(guild_id)
+        if ops is None:
+            ops = self._pending[guild_id] = []
+            latest = self._latest[guild_id] = {}
+        else:
+            latest = self._latest[guild_id]
+
+        op = data["op"]
+        if op in self.COALESCED:
+            index = latest.get(op)
+            if index is not None:
+                if op == "equalizer":
+                    bands = {band["band"]: band for band in ops[index]["bands"]}
+                    bands.update((band["band"], band) for band in data["bands"])
+                    data = dict(data, bands=list(bands.values()))
+                ops[index] = data
+                self.coalesced += 1
+                return
+            latest[op] = len(ops)
+        else:
+            latest.clear()
+        ops.append(data)
+
+        if self._handle is None:
+            loop = self.connection._loop
+            self._handle = loop.call_later(
+                self.window, lambda: loop.create_task(self.flush())
+            )
+
+    async def flush(self) -> None:
+        """Sends all queued ops immediately."""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        pending, self._pending, self._latest = self._pending, {}, {}
+        async with self._lock:
+            for guild_id, ops in pending.items():
+                for i, data in enumerate(ops):
+                    try:
+                        await self.connection._send_now(data)
+                    except Disconnected:
+                        log.warning(
+                            "Dropped %d queued ops for guild %d, not connected",
+                            len(ops) - i,
+                            guild_id,
+                        )
+                        break
+                    self.sent += 1
@@ -0,0 +1,31 @@
+from typing import Iterable, Tuple
+
+
+def encode_bands(gains: Iterable[Tuple[int, float]]) -> str:
+    """Encodes (band, gain) pairs as the JSON "bands" array of an equalizer op."""
+    return (
+        "["
+        + ",".join(f'{{"band":{band},"gain":{float(gain)!r}}}' for band, gain in gains)
+        + "]"
+    )
+
+
+class OpTemplates:
+    """
+    The pre-encoded JSON text of one guild's fixed-shape ops.
+    Complete ops (pause, resume and stop) are stored whole, the others as the prefix that the
+    variable part is appended to, so sending them skips building and encoding a dictionary.
+    :param guild_id: The guild the ops are for.
+    """
+
+    __slots__ = ("play", "pause", "resume", "stop", "volume", "seek", "equalizer")
+
+    def __init__(self, guild_id: int) -> None:
+        guild = f'"guildId":"{guild_id}"'
+        self.play = f'{{"op":"play",{guild},"track":"'
+        self.pause = f'{{"op":"pause",{guild},"pause":true}}'
+        self.resume = f'{{"op":"pause",{guild},"pause":false}}'
+        self.stop = f'{{"op":"stop",{guild}}}'
+        self.volume = f'{{"op":"volume",{guild},"volume":'
+        self.seek = f'{{"op":"seek",{guild},"position":'
+        self.equalizer = f'{{"op":"equalizer",{guild},"bands":'
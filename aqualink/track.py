@@ -1,39 +1,257 @@
-class Track:
-
-    __slots__ = (
-        "track",
-        "_info",
-        "identifier",
-        "seekable",
-        "author",
-        "length",
-        "stream",
-        "position",
-        "title",
-        "url",
-        "thumbnail",
-    )
-
-    def __init__(self, **kwargs):
-        self.track = kwargs["track"]
-        self._info = kwargs["info"]
-        self.identifier = self._info.get("identifier")
-        self.seekable = self._info.get("isSeekable")
-        self.author = self._info.get("author")
-        self.length = self._info.get("length")
-        self.stream = self._info.get("isStream")
-        self.position = self._info.get("position")
-        self.title = self._info.get("title")
-        self.url = self._info.get("uri")
-        self.thumbnail = (
-            f"https://img.youtube.com/vi/{self.identifier}/default.jpg"
-            if "youtube" in self.url
-            else ""
-        )
-
-    def __repr__(self):
-        return (
-            f"<Track title={self.title} length={self.length}>"
-            if self.title and self.length
-            else f"<Track track={self.track}>"
-        )
+import struct
+from array import array
+from base64 import b64decode, b64encode
+from collections.abc import Sequence
+from typing import Iterable, Iterator, List, Union
+
+TRACK_INFO_VERSIONED = 1
+
+
+def _read_utf(data: bytes, offset: int):
+    (size,) = struct.unpack_from(">H", data, offset)
+    offset += 2
+    raw = data[offset : offset + size]
+    try:
+        text = raw.decode()
+    except UnicodeDecodeError:
+        # java's modified UTF-8 encodes NUL as two bytes and astral characters as surrogate pairs
+        text = (
+            raw.replace(b"\xc0\x80", b"\x00")
+            .decode("utf-8", "surrogatepass")
+            .encode("utf-16", "surrogatepass")
+            .decode("utf-16")
+        )
+    return text, offset + size
+
+
+def _write_utf(text: str) -> bytes:
+    if "\x00" in text or (text and max(text) > "\uffff"):
+        chars = []
+        for char in text:
+            point = ord(char)
+            if point > 0xFFFF:
+                point -= 0x10000
+                chars.append(chr(0xD800 | (point >> 10)))
+                chars.append(chr(0xDC00 | (point & 0x3FF)))
+            else:
+                chars.append(char)
+        raw = "".join(chars).encode("utf-8", "surrogatepass")
+        raw = raw.replace(b"\x00", b"\xc0\x80")
+    else:
+        raw = text.encode()
+    return struct.pack(">H", len(raw)) + raw
+
+
+def decode_track(track: str) -> dict:
+    """
+    Decodes a base64 track string into its info dictionary without asking Lavalink.
+    :param track: The base64 track string, as found in :attr:`Track.track`.
+    :return: A dictionary shaped like the "info" key of a /loadtracks result.
+    """
+    data = b64decode(track)
+    (header,) = struct.unpack_from(">I", data, 0)
+    flags = header >> 30
+    offset = 4
+    if flags & TRACK_INFO_VERSIONED:
+        version = data[offset]
+        offset += 1
+    else:
+        version = 1
+
+    title, offset = _read_utf(data, offset)
+    author, offset = _read_utf(data, offset)
+    (length,) = struct.unpack_from(">q", data, offset)
+    offset += 8
+    identifier, offset = _read_utf(data, offset)
+    stream = data[offset] != 0
+    offset += 1
+    uri = None
+    if version >= 2 and data[offset]:
+        uri, offset = _read_utf(data, offset + 1)
+    elif version >= 2:
+        offset += 1
+    if version >= 3:
+        # artwork URL and ISRC
+        for _ in range(2):
+            if data[offset]:
+                _, offset = _read_utf(data, offset + 1)
+            else:
+                offset += 1
+    source, offset = _read_utf(data, offset)
+    # source specific data may follow, the position is always the last field
+    (position,) = struct.unpack_from(">q", data, len(data) - 8)
+
+    return {
+        "title": title,
+        "author": author,
+        "length": length,
+        "identifier": identifier,
+        "isStream": stream,
+        "isSeekable": not stream,
+        "uri": uri,
+        "sourceName": source,
+        "position": position,
+    }
+
+
+def encode_track(info: dict) -> str:
+    """
+    Encodes an info dictionary into a base64 track string Lavalink can play.
+    Source specific data (e.g. for HTTP sources) is not preserved.
+    :param info: A dictionary shaped like the "info" key of a /loadtracks result. "sourceName" defaults to youtube.
+    :return: The base64 track string.
+    """
+    body = bytearray()
+    body.append(2)  # version
+    body += _write_utf(info["title"])
+    body += _write_utf(info["author"])
+    body += struct.pack(">q", info["length"])
+    body += _write_utf(info["identifier"])
+    body.append(1 if info["isStream"] else 0)
+    if info.get("uri") is None:
+        body.append(0)
+    else:
+        body.append(1)
+        body += _write_utf(info["uri"])
+    body += _write_utf(info.get("sourceName", "youtube"))
+    body += struct.pack(">q", info.get("position", 0))
+    header = struct.pack(">I", (TRACK_INFO_VERSIONED << 30) | len(body))
+    return b64encode(header + body).decode()
+
+
+class Track:
+
+    __slots__ = (
+        "track",
+        "_info",
+        "identifier",
+        "seekable",
+        "author",
+        "length",
+        "stream",
+        "position",
+        "title",
+        "url",
+        "thumbnail",
+    )
+
+    def __init__(self, **kwargs):
+        self.track = kwargs["track"]
+        self._info = kwargs["info"]
+        self.identifier = self._info.get("identifier")
+        self.seekable = self._info.get("isSeekable")
+        self.author = self._info.get("author")
+        self.length = self._info.get("length")
+        self.stream = self._info.get("isStream")
+        self.position = self._info.get("position")
+        self.title = self._info.get("title")
+        self.url = self._info.get("uri")
+        self.thumbnail = (
+            f"https://img.youtube.com/vi/{self.identifier}/default.jpg"
+            if self.url and "youtube" in self.url
+            else ""
+        )
+
+    @classmethod
+    def from_blob(cls, track: str) -> "Track":
+        """Builds a Track from its base64 track string alone, without a REST call."""
+        return cls(track=track, info=decode_track(track))
+
+    def __repr__(self):
+        return (
+            f"<Track title={self.title} length={self.length}>"
+            if self.title and self.length
+            else f"<Track track={self.track}>"
+        )
+
+
+_SEEKABLE = 1
+_STREAM = 2
+
+
+class TrackList(Sequence):
+    """
+    An immutable sequence of Tracks stored column by column.
+    It keeps the base64 track strings and info fields instead of a Track and an info dictionary
+    per entry, and only builds a :class:`Track` when one is indexed or iterated over.
+    Returned by :meth:`Connection.query` with ``lazy=True``.
+    """
+
+    __slots__ = (
+        "_tracks",
+        "_titles",
+        "_authors",
+        "_identifiers",
+        "_uris",
+        "_lengths",
+        "_positions",
+        "_flags",
+    )
+
+    def __init__(self, data: Iterable[dict] = ()) -> None:
+        self._tracks = []
+        self._titles = []
+        self._authors = []
+        self._identifiers = []
+        self._uris = []
+        self._lengths = array("q")
+        self._positions = array("q")
+        self._flags = bytearray()
+        authors = {}  # playlists tend to repeat authors, store each one once
+        for entry in data:
+            info = entry["info"]
+            author = info.get("author")
+            self._tracks.append(entry["track"])
+            self._titles.append(info.get("title"))
+            self._authors.append(authors.setdefault(author, author))
+            self._identifiers.append(info.get("identifier"))
+            self._uris.append(info.get("uri"))
+            self._lengths.append(info.get("length") or 0)
+            self._positions.append(info.get("position") or 0)
+            self._flags.append(
+                (_SEEKABLE if info.get("isSeekable") else 0)
+                | (_STREAM if info.get("isStream") else 0)
+            )
+
+    def __len__(self) -> int:
+        return len(self._tracks)
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[Track, "TrackList"]:
+        if isinstance(index, slice):
+            sliced = TrackList()
+            for name in self.__slots__:
+                setattr(sliced, name, getattr(self, name)[index])
+            return sliced
+        if index < 0:
+            index += len(self._tracks)
+        flags = self._flags[index]
+        return Track(
+            track=self._tracks[index],
+            info={
+                "identifier": self._identifiers[index],
+                "isSeekable": bool(flags & _SEEKABLE),
+                "author": self._authors[index],
+                "length": self._lengths[index],
+                "isStream": bool(flags & _STREAM),
+                "position": self._positions[index],
+                "title": self._titles[index],
+                "uri": self._uris[index],
+            },
+        )
+
+    def __iter__(self) -> Iterator[Track]:
+        for index in range(len(self._tracks)):
+            yield self[index]
+
+    def __repr__(self):
+        return f"<TrackList length={len(self)}>"
+
+    @property
+    def tracks(self) -> List[str]:
+        """Returns the base64 track strings without building Tracks."""
+        return list(self._tracks)
+
+    @property
+    def titles(self) -> List[str]:
+        """Returns the track titles without building Tracks."""
+        return list(self._titles)
@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from inspect import isawaitable
+from typing import Callable, NamedTuple, Optional
+
+log = logging.getLogger(__name__)
+
+
+class Offender(NamedTuple):
+    """Something that kept the event loop or a guild's events busy for longer than the threshold."""
+
+    kind: str  # "loop", "callback" or "frame"
+    name: str  # the callback's qualified name or the frame's op
+    guild_id: Optional[int]
+    duration: float
+
+
+class Watchdog:
+    """
+    Reports event loop stalls, slow event callbacks and slow Lavalink frames of a :class:`Connection`.
+    Enable it with ``Connection(bot, watchdog=0.1)``, the other parameters are the ``watchdog_``
+    prefixed arguments of :class:`Connection`. The event loop lag is measured continuously,
+    callbacks and frames are timed for a random ``sample_rate`` share of them.
+    Offenders are passed to ``hook`` if it is set (it may be awaitable) and logged otherwise.
+    :param connection: The :class:`Connection` to watch.
+    :param threshold: The duration in seconds above which something is reported.
+    :param interval: (optional) How often the event loop lag is measured in seconds. A stall is only seen
+        when it delays a measurement, so this defaults to a quarter of the threshold.
+    :param sample_rate: The share (0 to 1) of callbacks and frames that are timed.
+    :param hook: (optional) A callable receiving each :class:`Offender`.
+    """
+
+    def __init__(
+        self,
+        connection,
+        threshold: float = 0.1,
+        interval: Optional[float] = None,
+        sample_rate: float = 0.1,
+        hook: Optional[Callable] = None,
+    ) -> None:
+        self.connection = connection
+        self.threshold = threshold
+        self.interval = interval if interval is not None else threshold / 4
+        self.sample_rate = sample_rate
+        self.hook = hook
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.recent = deque(maxlen=100)  # the latest offenders
+        self._task = None
+
+    def start(self) -> None:
+        """Starts measuring the event loop lag. Called by :meth:`Connection.connect`."""
+        if self._task is None or self._task.done():
+            self._task = self.connection._loop.create_task(self._measure())
+
+    def stop(self) -> None:
+        """Stops measuring the event loop lag."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def sample(self) -> bool:
+        """Returns whether the next callback or frame should be timed."""
+        return random.random() < self.sample_rate
+
+    def check(self, kind: str, name: str, guild_id, duration: float) -> None:
+        """Reports a timed callback or frame if it took longer than the threshold."""
+        if duration < self.threshold:
+            return
+        offender = Offender(
+            kind, name, int(guild_id) if guild_id is not None else None, duration
+        )
+        self.recent.append(offender)
+        if self.hook is None:
+            if kind == "loop":
+                log.warning("The event loop was blocked for %.3fs", duration)
+            else:
+                log.warning(
+                    "Slow %s %s of guild %s took %.3fs", kind, name, guild_id, duration
+                )
+            return
+        try:
+            out = self.hook(offender)
+            if isawaitable(out):
+                asyncio.ensure_future(out)
+        except Exception:
+            log.exception("Ignoring exception in watchdog hook %r", self.hook)
+
+    def check_callback(self, callback: Callable, guild_id, duration: float) -> None:
+        """Reports a timed event callback if it took longer than the threshold."""
+        if duration >= self.threshold:
+            name = getattr(callback, "__qualname__", None) or repr(callback)
+            self.check("callback", name, guild_id, duration)
+
+    async def _measure(self) -> None:
+        metrics = self.connection.metrics
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lag = max(time.perf_counter() - start - self.interval, 0.0)
+            self.max_lag = max(self.max_lag, self.lag)
+            if metrics is not None:
+                metrics.observe("aqualink_loop_lag_seconds", (), self.lag)
+            self.check("loop", "event loop", None, self.lag)
@@ -0,0 +1,99 @@
+"""
+Measures decode and encode throughput of the available JSON codecs on
+Lavalink-shaped payloads (playerUpdate, stats, a 100 track /loadtracks result
+and common outbound ops).
+
+Usage: python benchmarks/codec.py [--seconds 0.5]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from aqualink.codec import CODECS  # noqa: E402
+from fakelink import make_tracks  # noqa: E402
+
+PAYLOADS = {
+    "playerUpdate": {
+        "op": "playerUpdate",
+        "guildId": "453391932507897856",
+        "state": {"time": 1539474291134, "position": 81234},
+    },
+    "stats": {
+        "op": "stats",
+        "players": 1203,
+        "playingPlayers": 1021,
+        "uptime": 182910249,
+        "memory": {
+            "free": 121021920,
+            "used": 902812212,
+            "allocated": 1023834112,
+            "reservable": 4294967296,
+        },
+        "cpu": {"cores": 8, "systemLoad": 0.3121, "lavalinkLoad": 0.2012},
+        "frameStats": {"sent": 3061120, "nulled": 12, "deficit": 310},
+    },
+    "loadtracks": {
+        "loadType": "PLAYLIST_LOADED",
+        "playlistInfo": {"name": "Some playlist", "selectedTrack": -1},
+        "tracks": make_tracks(100),
+    },
+}
+
+OPS = {
+    "play": {
+        "op": "play",
+        "guildId": "453391932507897856",
+        "track": PAYLOADS["loadtracks"]["tracks"][0]["track"],
+        "startTime": 0,
+    },
+    "volume": {"op": "volume", "guildId": "453391932507897856", "volume": 80},
+    "equalizer": {
+        "op": "equalizer",
+        "guildId": "453391932507897856",
+        "bands": [{"band": band, "gain": 0.25} for band in range(15)],
+    },
+}
+
+
+def rate(func, arg, seconds: float) -> float:
+    count = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while True:
+        for _ in range(100):
+            func(arg)
+        count += 100
+        now = time.perf_counter()
+        if now >= deadline:
+            return count / (now - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--seconds", type=float, default=0.5)
+    args = parser.parse_args()
+
+    codecs = []
+    for factory in CODECS.values():
+        try:
+            codecs.append(factory())
+        except ImportError:
+            pass
+
+    print(f"{'payload':<24}" + "".join(f"{codec.name:>14}" for codec in codecs))
+    reference = codecs[-1].dumps
+    for name, payload in PAYLOADS.items():
+        raw = reference(payload)
+        rates = [rate(codec.loads, raw, args.seconds) for codec in codecs]
+        print(f"{'loads ' + name:<24}" + "".join(f"{r:>12,.0f}/s" for r in rates))
+    for name, payload in OPS.items():
+        rates = [rate(codec.dumps, payload, args.seconds) for codec in codecs]
+        print(f"{'dumps ' + name:<24}" + "".join(f"{r:>12,.0f}/s" for r in rates))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+An in-process stand-in for Lavalink and a Discord bot, used by the benchmarks.
+
+FakeLavalink serves a websocket that records received ops and can push frames
+to aqualink, and a /loadtracks endpoint. Identifiers of the form
+"playlist:<n>" return a playlist of n tracks, anything else a single track.
+"""
+
+import asyncio
+import json
+import os
+import sys
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from aqualink.track import encode_track  # noqa: E402
+
+PASSWORD = "youshallnotpass"
+
+
+def make_info(i: int) -> dict:
+    return {
+        "identifier": f"{i:011d}",
+        "isSeekable": True,
+        "author": "Some Artist",
+        "length": 180000 + i,
+        "isStream": False,
+        "position": 0,
+        "title": f"Some Artist - Song number {i} (Official Video)",
+        "uri": f"https://www.youtube.com/watch?v={i:011d}",
+    }
+
+
+def make_tracks(count: int) -> list:
+    return [
+        {
+            "track": encode_track(dict(make_info(i), sourceName="youtube")),
+            "info": make_info(i),
+        }
+        for i in range(count)
+    ]
+
+
+class FakeLavalink:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.host = host
+        self.port = port
+        self.received = 0
+        self.ops = []
+        self.record = False
+        self.sockets = []
+        self.rest_delay = 0.0
+        self._playlists = {}
+        self._runner = None
+
+    @property
+    def ws_url(self) -> str:
+        return f"ws://{self.host}:{self.port}/"
+
+    @property
+    def rest_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_get("/", self._websocket)
+        app.router.add_get("/loadtracks", self._loadtracks)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        for ws in self.sockets:
+            await ws.close()
+        await self._runner.cleanup()
+
+    async def send(self, frames) -> None:
+        """Pushes pre-serialized frames to every connected client."""
+        for ws in self.sockets:
+            for frame in frames:
+                await ws.send_str(frame)
+
+    async def wait_received(self, count: int) -> None:
+        while self.received < count:
+            await asyncio.sleep(0.001)
+
+    async def _websocket(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.sockets.append(ws)
+        async for message in ws:
+            self.received += 1
+            if self.record:
+                self.ops.append(json.loads(message.data))
+        self.sockets.remove(ws)
+        return ws
+
+    async def _loadtracks(self, request):
+        if request.headers.get("Authorization") != PASSWORD:
+            return web.Response(status=401)
+        if self.rest_delay:
+            await asyncio.sleep(self.rest_delay)
+        identifier = request.query["identifier"]
+        body = self._playlists.get(identifier)
+        if body is None:
+            if identifier.startswith("playlist:"):
+                tracks = make_tracks(int(identifier[9:]))
+                load_type = "PLAYLIST_LOADED"
+            else:
+                tracks = make_tracks(1)
+                load_type = "SEARCH_RESULT"
+            body = json.dumps(
+                {
+                    "loadType": load_type,
+                    "playlistInfo": {"name": identifier, "selectedTrack": -1},
+                    "tracks": tracks,
+                }
+            )
+            self._playlists[identifier] = body
+        return web.Response(text=body, content_type="application/json")
+
+
+class FakeDiscordSocket:
+    """Answers voice state updates like Discord would, with a voice state and a voice server update."""
+
+    open = True
+
+    def __init__(self, bot) -> None:
+        self.bot = bot
+        self.sent = 0
+
+    async def send(self, data) -> None:
+        self.sent += 1
+        payload = json.loads(data)
+        if payload["op"] == 4 and payload["d"]["channel_id"] is not None:
+            self.bot.loop.create_task(self._voice_connect(payload["d"]))
+
+    async def _voice_connect(self, data) -> None:
+        guild_id = data["guild_id"]
+        events = (
+            {
+                "t": "VOICE_STATE_UPDATE",
+                "d": {
+                    "guild_id": guild_id,
+                    "user_id": str(self.bot.user.id),
+                    "session_id": f"session-{guild_id}",
+                    "channel_id": data["channel_id"],
+                },
+            },
+            {
+                "t": "VOICE_SERVER_UPDATE",
+                "d": {"guild_id": guild_id, "token": "token", "endpoint": "localhost"},
+            },
+        )
+        for event in events:
+            for listener in self.bot.listeners.get("on_socket_response", ()):
+                await listener(dict(event, op=0))
+
+
+class FakeUser:
+    id = 1
+
+
+class FakeBot:
+    """Just enough of a discord.py bot for :class:`aqualink.Connection`."""
+
+    def __init__(self, loop, shard_count: int = 1) -> None:
+        self.loop = loop
+        self.shard_count = shard_count
+        self.shard_id = None
+        self.user = FakeUser()
+        self.ws = FakeDiscordSocket(self)
+        self.listeners = {}
+
+    def add_listener(self, func, name) -> None:
+        self.listeners.setdefault(name, []).append(func)
+
+    async def wait_until_ready(self) -> None:
+        pass
+
+    def get_guild(self, guild_id):
+        return None
+
+    def get_channel(self, channel_id):
+        return None
+
+
+async def connect(loop, shard_count: int = 1, **kwargs):
+    """Starts a FakeLavalink and returns it with a Connection connected to it."""
+    from aqualink import Connection
+
+    server = FakeLavalink()
+    await server.start()
+    connection = Connection(FakeBot(loop, shard_count), **kwargs)
+    await connection.connect(PASSWORD, server.ws_url, server.rest_url)
+    return server, connection
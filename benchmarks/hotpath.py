@@ -0,0 +1,189 @@
+"""
+Measures aqualink's own overhead on its hot paths against an in-process fake Lavalink.
+
+Results are printed as JSON (or written to --output) so runs of different
+versions can be compared.
+
+Usage: python benchmarks/hotpath.py [--quick] [--output results.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import time
+
+from fakelink import connect, make_tracks
+
+from aqualink import Track, TrackList
+
+
+async def bench_frames(server, connection, count: int) -> dict:
+    guilds = [i << 22 for i in range(1, 1001)]
+    for guild in guilds:
+        # frames are only applied to players of the node they come from
+        connection._node_for(connection.get_player(guild))
+    frames = [
+        json.dumps(
+            {
+                "op": "playerUpdate",
+                "guildId": str(guilds[i % len(guilds)]),
+                "state": {"time": int(time.time() * 1000), "position": i},
+            }
+        )
+        for i in range(count)
+    ]
+    done = asyncio.Event()
+    connection.add_listener("TrackStartEvent", lambda: done.set())
+    sentinel = json.dumps(
+        {"op": "event", "type": "TrackStartEvent", "guildId": str(guilds[0])}
+    )
+    start = time.perf_counter()
+    await server.send(frames + [sentinel])
+    await done.wait()
+    elapsed = time.perf_counter() - start
+    return {"frames": count, "seconds": elapsed, "frames_per_second": count / elapsed}
+
+
+async def bench_send(server, connection, count: int) -> dict:
+    player = connection.get_player(1 << 22)
+    await player.set_volume(100)
+    await server.wait_received(2)  # configureResuming and the warm up op
+    received = server.received
+    start = time.perf_counter()
+    for i in range(count):
+        await player.set_volume(i % 150)
+    sent = time.perf_counter() - start
+    await server.wait_received(received + count)
+    elapsed = time.perf_counter() - start
+    return {
+        "ops": count,
+        "seconds": sent,
+        "ops_per_second": count / sent,
+        "delivered_ops_per_second": count / elapsed,
+    }
+
+
+def bench_tracks(count: int) -> dict:
+    data = make_tracks(count)
+    start = time.perf_counter()
+    [Track(**track) for track in data]
+    elapsed = time.perf_counter() - start
+    start = time.perf_counter()
+    TrackList(data)
+    lazy = time.perf_counter() - start
+    return {
+        "tracks": count,
+        "seconds": elapsed,
+        "tracks_per_second": count / elapsed,
+        "tracklist_seconds": lazy,
+        "tracklist_tracks_per_second": count / lazy,
+    }
+
+
+def bench_get_player(connection, sizes, lookups: int) -> dict:
+    results = {}
+    for size in sizes:
+        connection._players.clear()
+        guilds = [random.getrandbits(63) for _ in range(size)]
+        start = time.perf_counter()
+        for guild in guilds:
+            connection.get_player(guild)
+        create = time.perf_counter() - start
+        sample = [random.choice(guilds) for _ in range(lookups)]
+        start = time.perf_counter()
+        for guild in sample:
+            connection.get_player(guild)
+        lookup = time.perf_counter() - start
+        results[str(size)] = {
+            "create_ns": create / size * 1e9,
+            "lookup_ns": lookup / lookups * 1e9,
+        }
+    connection._players.clear()
+    return results
+
+
+async def bench_query(connection, count: int, playlist: int) -> dict:
+    latencies = []
+    for i in range(count):
+        start = time.perf_counter()
+        await connection.query(f"ytsearch:song {i}")
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    start = time.perf_counter()
+    tracks = await connection.query(f"playlist:{playlist}")
+    cold = time.perf_counter() - start
+    start = time.perf_counter()
+    await connection.query(f"playlist:{playlist}")
+    warm = time.perf_counter() - start
+    return {
+        "queries": count,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(count * 0.95) - 1] * 1000,
+        "p99_ms": latencies[int(count * 0.99) - 1] * 1000,
+        "playlist_tracks": len(tracks),
+        "playlist_cold_ms": cold * 1000,
+        "playlist_ms": warm * 1000,
+    }
+
+
+def revision() -> str:
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "describe", "--always", "--dirty"],
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                stderr=subprocess.DEVNULL,
+            )
+            .decode()
+            .strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def run(args) -> dict:
+    loop = asyncio.get_event_loop()
+    scale = 10 if args.quick else 1
+    server, connection = await connect(loop)
+    try:
+        results = {
+            "event_processor": await bench_frames(server, connection, 100000 // scale),
+            "send": await bench_send(server, connection, 50000 // scale),
+            "track_construction": bench_tracks(5000),
+            "get_player": bench_get_player(
+                connection, (10000, 100000) if not args.quick else (10000,), 100000
+            ),
+            "query": await bench_query(connection, 500 // scale, 5000),
+        }
+    finally:
+        await connection.session.close()
+        await server.stop()
+    return {
+        "revision": revision(),
+        "python": platform.python_version(),
+        "codec": connection.codec.name,
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--quick", action="store_true", help="run smaller workloads")
+    parser.add_argument("--output", help="write the JSON results to this file")
+    args = parser.parse_args()
+
+    loop = asyncio.get_event_loop()
+    report = json.dumps(loop.run_until_complete(run(args)), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
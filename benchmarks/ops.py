@@ -0,0 +1,107 @@
+"""
+Compares the cost of encoding and sending fixed-shape ops through the generic
+dictionary path and through the pre-encoded templates.
+
+Sent frames are discarded instead of written to the websocket so only
+aqualink's own work is measured, and the best of several rounds is reported. The dictionary path is what every op took before the templates and
+what ops still take when a coalesce window is set.
+
+Usage: python benchmarks/ops.py [--count 20000] [--rounds 5]
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+from fakelink import connect, make_tracks
+
+from aqualink import Equalizer, Track
+
+
+async def discard(data) -> None:
+    pass
+
+
+def generic_ops(connection, guild_id: int, track: str, preset):
+    bands = [{"band": band, "gain": gain} for band, gain in preset]
+    send = connection._send
+    return {
+        "play": lambda i: send(op="play", guildId=guild_id, track=track, startTime=i),
+        "pause": lambda i: send(op="pause", guildId=guild_id, pause=bool(i & 1)),
+        "stop": lambda i: send(op="stop", guildId=guild_id),
+        "volume": lambda i: send(op="volume", guildId=guild_id, volume=i % 150),
+        "seek": lambda i: send(op="seek", guildId=guild_id, position=i),
+        "equalizer": lambda i: send(op="equalizer", guildId=guild_id, bands=bands),
+    }
+
+
+def template_ops(connection, guild_id: int, track: str, preset):
+    return {
+        "play": lambda i: connection._play(guild_id, track, i / 1000, None),
+        "pause": lambda i: connection._pause_resume(guild_id, bool(i & 1)),
+        "stop": lambda i: connection._stop(guild_id),
+        "volume": lambda i: connection._volume(guild_id, i % 150),
+        "seek": lambda i: connection._seek(guild_id, i / 1000),
+        "equalizer": lambda i: connection._equalizer(guild_id, preset, preset.bands),
+    }
+
+
+async def measure(ops, count: int, rounds: int) -> dict:
+    results = {}
+    for name, op in ops.items():
+        for i in range(1000):
+            await op(i)
+        best = float("inf")
+        for _ in range(rounds):
+            start = time.perf_counter()
+            for i in range(count):
+                await op(i)
+            best = min(best, time.perf_counter() - start)
+        results[name] = best / count * 1e9
+    return results
+
+
+async def run(args) -> dict:
+    loop = asyncio.get_event_loop()
+    server, connection = await connect(loop)
+    connection._nodes[0]._socket.send = discard
+    guild_id = 1 << 22
+    track = Track(**make_tracks(1)[0]).track
+    preset = Equalizer.bassboost().high
+    try:
+        before = await measure(
+            generic_ops(connection, guild_id, track, preset), args.count, args.rounds
+        )
+        after = await measure(
+            template_ops(connection, guild_id, track, preset), args.count, args.rounds
+        )
+    finally:
+        await connection.session.close()
+        await server.stop()
+    return {
+        "codec": connection.codec.name,
+        "ops": args.count,
+        "ns_per_op": {
+            name: {
+                "dict": before[name],
+                "template": after[name],
+                "speedup": before[name] / after[name],
+            }
+            for name in before
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--count", type=int, default=20000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    loop = asyncio.get_event_loop()
+    print(json.dumps(loop.run_until_complete(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
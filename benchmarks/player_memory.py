@@ -0,0 +1,60 @@
+"""
+Measures the memory held per Player, with a flat and with a custom equalizer.
+
+Usage: python benchmarks/player_memory.py [--players 100000]
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import tracemalloc
+
+from fakelink import FakeBot
+
+from aqualink import Connection
+
+
+async def _discard(*args, **kwargs) -> None:
+    pass
+
+
+def measure(connection, count: int, customize=None) -> float:
+    connection._players.clear()
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for guild in range(1, count + 1):
+        player = connection.get_player(guild << 22)
+        if customize is not None:
+            customize(player)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    connection._players.clear()
+    return (after - before) / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--players", type=int, default=100000)
+    args = parser.parse_args()
+
+    connection = Connection(FakeBot(asyncio.get_event_loop()))
+    # only measure what the players keep
+    connection._send = connection._equalizer = _discard
+    results = {
+        "players": args.players,
+        "flat_eq_bytes_per_player": measure(connection, args.players),
+        "custom_eq_bytes_per_player": measure(
+            connection,
+            args.players,
+            lambda player: asyncio.get_event_loop().run_until_complete(
+                player.set_gains((0, 0.25))
+            ),
+        ),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Measures Connection.snapshot and Connection.restore for many players against
+an in-process fake Lavalink and a simulated Discord voice gateway.
+
+Restoring runs with --rate voice connections per second per shard, so the
+benchmark finishes quickly; the report also states how long the same restore
+takes at the default gateway-safe pacing.
+
+Usage: python benchmarks/restore.py [--players 10000] [--shards 16] [--rate 1000]
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import tempfile
+import time
+
+from fakelink import FakeBot, PASSWORD, connect, make_tracks
+
+from aqualink import Connection, Track
+
+
+async def run(args) -> dict:
+    loop = asyncio.get_event_loop()
+    server, connection = await connect(loop, args.shards)
+    tracks = [Track(**data) for data in make_tracks(100)]
+
+    for i in range(args.players):
+        player = connection.get_player((i + 1) << 22 | i)
+        await player.connect(1000 + i)
+    await asyncio.sleep(0.1)  # let the simulated voice connections finish
+    for i, player in enumerate(list(connection._players.values())):
+        await player.play(tracks[i % len(tracks)], start_time=i % 180)
+        if i % 10 == 0:
+            await player.set_pause(True)
+        if i % 4 == 0:
+            await player.set_volume(50)
+
+    path = os.path.join(tempfile.mkdtemp(), "players.snapshot")
+    start = time.perf_counter()
+    saved = await connection.snapshot(path)
+    snapshot_seconds = time.perf_counter() - start
+
+    restored_connection = Connection(
+        FakeBot(loop, args.shards), voice_rate=args.rate, voice_burst=5
+    )
+    await restored_connection.connect(PASSWORD, server.ws_url, server.rest_url)
+    received = server.received
+    start = time.perf_counter()
+    restored = await restored_connection.restore(path, concurrency=args.concurrency)
+    restore_seconds = time.perf_counter() - start
+    ops = server.received - received
+
+    per_shard = max(
+        sum(1 for i in range(args.players) if (i + 1) % args.shards == shard)
+        for shard in range(args.shards)
+    )
+    default = Connection(FakeBot(loop, args.shards))
+    gateway_seconds = max(0, per_shard - default._voice_burst) / default._voice_rate
+
+    await connection.session.close()
+    await restored_connection.session.close()
+    await server.stop()
+    return {
+        "players": args.players,
+        "shards": args.shards,
+        "snapshot_players": saved,
+        "snapshot_seconds": snapshot_seconds,
+        "snapshot_bytes": os.path.getsize(path),
+        "restored_players": restored,
+        "restore_seconds": restore_seconds,
+        "restore_ops": ops,
+        "restore_rate_per_shard": args.rate,
+        "max_players_per_shard": per_shard,
+        "gateway_paced_restore_seconds": math.ceil(gateway_seconds),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--players", type=int, default=10000)
+    parser.add_argument("--shards", type=int, default=16)
+    parser.add_argument("--rate", type=float, default=1000.0)
+    parser.add_argument("--concurrency", type=int, default=200)
+    args = parser.parse_args()
+
+    loop = asyncio.get_event_loop()
+    print(json.dumps(loop.run_until_complete(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
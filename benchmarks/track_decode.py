@@ -0,0 +1,84 @@
+"""
+Compares rebuilding Track objects from stored base64 track strings locally
+against resolving them through Lavalink's /decodetracks REST endpoint.
+
+Usage: python benchmarks/track_decode.py [--count 5000] [--rest-url http://localhost:2333 --password youshallnotpass]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from aqualink.track import Track, encode_track  # noqa: E402
+
+
+def make_blobs(count: int):
+    return [
+        encode_track(
+            {
+                "title": f"Some Artist - Song number {i} (Official Video)",
+                "author": "Some Artist",
+                "length": 180000 + i,
+                "identifier": f"{i:011d}",
+                "isStream": False,
+                "uri": f"https://www.youtube.com/watch?v={i:011d}",
+                "sourceName": "youtube",
+            }
+        )
+        for i in range(count)
+    ]
+
+
+def bench_local(blobs):
+    start = time.perf_counter()
+    tracks = [Track.from_blob(blob) for blob in blobs]
+    return time.perf_counter() - start, tracks
+
+
+async def bench_rest(blobs, rest_url: str, password: str, batch: int):
+    import aiohttp
+
+    headers = {"Authorization": password, "Content-Type": "application/json"}
+    async with aiohttp.ClientSession() as session:
+        start = time.perf_counter()
+        tracks = []
+        for i in range(0, len(blobs), batch):
+            async with session.post(
+                f"{rest_url}/decodetracks", json=blobs[i : i + batch], headers=headers
+            ) as resp:
+                tracks.extend(Track(**data) for data in await resp.json())
+        return time.perf_counter() - start, tracks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--count", type=int, default=5000)
+    parser.add_argument("--rest-url")
+    parser.add_argument("--password", default="youshallnotpass")
+    parser.add_argument("--batch", type=int, default=1000)
+    args = parser.parse_args()
+
+    blobs = make_blobs(args.count)
+    elapsed, _ = bench_local(blobs)
+    print(
+        f"local:  {args.count} tracks in {elapsed * 1000:.1f} ms "
+        f"({args.count / elapsed:,.0f} tracks/s)"
+    )
+
+    if args.rest_url:
+        loop = asyncio.get_event_loop()
+        elapsed, _ = loop.run_until_complete(
+            bench_rest(blobs, args.rest_url, args.password, args.batch)
+        )
+        print(
+            f"REST:   {args.count} tracks in {elapsed * 1000:.1f} ms "
+            f"({args.count / elapsed:,.0f} tracks/s)"
+        )
+
+
+if __name__ == "__main__":
+    main()
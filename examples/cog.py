@@ -12,7 +12,7 @@ class Music:
             "https://www.youtube.com/playlist",
         )  # ToDo: Find more of these
         self.bot = bot
-        self.queue = {}  # {guild: [text channel, [queued songs]]}
+        self.channels = {}  # {guild: text channel}
         bot.loop.create_task(self.connect())
 
     async def connect(self):
@@ -25,14 +25,12 @@ class Music:
 
     async def track_callback(self, player):
         """A callback invoked when the song is done playing."""
-        queue_data = self.queue[player.guild]  # get the queue data
-        if not queue_data[1]:  # no more songs left
+        # the player already started the next queued track, if there was one
+        if not player.track:  # no more songs left
             await player.disconnect()  # stop the player
-            del self.queue[player.guild]
+            del self.channels[player.guild]
         else:
-            track = queue_data[1].pop(0)  # get the next song
-            await player.play(track)  # play it
-            await queue_data[0].send(f"Playing {track.title}")
+            await self.channels[player.guild].send(f"Playing {player.track.title}")
 
     @commands.command()
     async def play(self, ctx, *, query: str):
@@ -47,22 +45,22 @@ class Music:
             is_playlist = False
             tracks = await player.query(f"ytsearch: {query}")
         track = tracks[0]
-        if self.queue.get(ctx.guild):
+        if self.channels.get(ctx.guild):
             if is_playlist:
-                self.queue[ctx.guild][1].extend(tracks)  # add all to the queue
+                player.queue.add(*tracks)  # add all to the queue
                 await ctx.send(
                     f"Added a playlist with {len(tracks)} tracks to the queue."
                 )
             else:
-                self.queue[ctx.guild][1].append(track)
+                player.queue.add(track)
                 await ctx.send(f"Added {track.title} to the queue")
         else:
+            self.channels[ctx.guild] = ctx.channel
             if is_playlist:
-                self.queue[ctx.guild] = [ctx.channel, tracks[1:]]
+                player.queue.add(*tracks[1:])
                 await player.play(track)
                 await ctx.send(f"Playing a playlist with {len(tracks)} tracks.")
             else:
-                self.queue[ctx.guild] = [ctx.channel, []]
                 await player.play(track)  # plays the track
                 await ctx.send(f"Playing {track.title}")
         player.track_callback = self.track_callback  # set an event for track end
@@ -72,7 +70,7 @@ class Music:
         """Skip the current song."""
         player = self.bot.aqualink.get_player(ctx.guild.id)
         if player.paused or player.playing:
-            await player.stop()
+            await player.play_next()  # plays the next queued song or stops
             await ctx.message.add_reaction("✅")
         else:
             await ctx.send("I'm not playing...")
@@ -81,10 +79,9 @@ class Music:
     async def _queue(self, ctx):
         """Shows up to 5 queued songs."""
         player = self.bot.aqualink.get_player(ctx.guild.id)
-        queue = self.queue.get(ctx.guild)
-        if not queue:
+        if not self.channels.get(ctx.guild):
             return await ctx.send("I am not playing at all.")
-        queue = queue[1][:5]
+        queue = [player.queue[i] for i in range(min(len(player.queue), 5))]
         if not queue:
             return await ctx.send("No more upcoming tracks...")
         queue_text = "\n".join(f"{t.title} by {t.author}" for t in queue)
@@ -126,7 +123,8 @@ class Music:
         if not player.connected or not ctx.guild.me.voice:
             return await ctx.send("I'm not playing.")
         player.track_callback = None  # prevent unusual behavior
-        del self.queue[ctx.guild]
+        player.queue.clear()
+        del self.channels[ctx.guild]
         await player.stop()
         await player.disconnect()
         await ctx.send("Stopped.")
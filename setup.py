@@ -20,6 +20,7 @@ setuptools.setup(
     packages=setuptools.find_packages(),
     license="MIT",
     install_requires=requirements,
+    extras_require={"orjson": ["orjson"], "ujson": ["ujson"]},
     classifiers=(
         "Programming Language :: Python :: 3.6",
         "License :: OSI Approved :: MIT License",